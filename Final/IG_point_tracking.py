@@ -2,8 +2,6 @@
 # import necessary libraries
 from flask import Flask, request, jsonify, render_template, session, redirect, url_for, Response
 from flask_cors import CORS
-import pytesseract
-from PIL import Image
 import io
 from difflib import SequenceMatcher
 from datetime import datetime, timedelta
@@ -13,50 +11,231 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import csv
 import re
+import string
+import logging
+import gzip
+import base64
+import atexit
+import time
+import bisect
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import multiprocessing
+import uuid
+
+from sqlite_store import SQLiteStore
+from atomicfile import atomic_open
+from rwlock import ReadWriteLock
+import metrics
+import ocr_engine
+import ocr_worker
+import preprocess
+import dedupe
+from ranking import Leaderboard
+import state_snapshot
+from ocr_parser import parse_screenshot_text
 
 try:
-    from dateutil import parser as date_parser
+    import brotli
 except ImportError:
-    date_parser = None  # will skip date extraction if not installed
+    brotli = None  # falls back to gzip
 
 app = Flask(__name__)
 CORS(app)
 app.secret_key = 'your-secret-key-here-change-this-in-production' # for session management lol
 
-# set tesseract path for Mac - update if your path is different
-pytesseract.pytesseract.tesseract_cmd = '/opt/homebrew/bin/tesseract'  # for M1/M2 Macs
-# if you have an Intel Mac, uncomment this line instead:
-# pytesseract.pytesseract.tesseract_cmd = '/usr/local/bin/tesseract'
+# logging level comes from IG_LOG_LEVEL - DEBUG shows full OCR text + every point update,
+# the default INFO keeps production logs to one line per upload
+LOG_LEVEL = os.environ.get('IG_LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+logger = logging.getLogger('ig_point_tracking')
 
 # point calculation stuff - matches the og project plan
 FUZZY_MATCH_THRESHOLD = 0.8
 MAX_POINTS_PER_COMMENT = 4
 POINTS = { "likers": 1, "commenters": 1, "tagged_users": 5 }
+UNDO_HISTORY_LIMIT = 200  # how many uploads can be undone
+MAX_BATCH_SIZE = 50  # most screenshots accepted by one batch upload
+JOB_WORKERS = 2  # background threads working through queued screenshot jobs
+MAX_JOBS_KEPT = 200  # finished jobs we remember for status polling
 
 # where all my files live :)
 CREDENTIALS_FILE = 'credentials.json'
 ROSTER_FILE = 'F25IGPointTracking - Sheet1.csv'
-INTERACTIONS_FILE = 'interactions.json'
+ROSTER_ARCHIVE_FILE = 'roster_archive.csv'  # members dropped by a roster upload, points and all
+INTERACTIONS_FILE = 'interactions.json'  # snapshot
+INTERACTIONS_LOG_FILE = 'interactions.log.jsonl'  # events since the snapshot
+STATE_SNAPSHOT_FILE = 'state.snapshot'  # binary copy of all of the above for quick restarts (see state_snapshot.py)
 ACTIVITY_FILE = 'last_activity.json'
+OCR_CACHE_DIR = 'ocr_cache'  # None = no OCR cache (size cap is in ocr_worker.py)
+
+# storage backend - 'files' (CSV/JSON above) or 'sqlite' so several workers can share state
+STORAGE_BACKEND = os.environ.get('IG_STORAGE', 'files')
+SQLITE_FILE = os.environ.get('IG_SQLITE_FILE', 'ig_points.db')
+
+# OCR engine - 'tesserocr' keeps tesseract loaded in each worker, 'pytesseract' runs the
+# tesseract command per image, 'auto' uses tesserocr when it's installed (see ocr_engine.py)
+# the tesseract binary is found on PATH, or set TESSERACT_CMD if it lives somewhere odd
+OCR_ENGINE = os.environ.get('IG_OCR_ENGINE', 'auto')
+HANDLE_CHARS = string.ascii_letters + string.digits + '._@'
+
+# screen regions as (left, top, right, bottom) fractions - everything below the status bar,
+# the username column of a likes list (no avatars / Follow buttons), or just the top of a
+# tag notification
+BELOW_STATUS_BAR = (0.0, 0.06, 1.0, 1.0)
+LIKES_USERNAME_COLUMN = (0.12, 0.06, 0.75, 1.0)
+TAG_HEADER = (0.0, 0.06, 1.0, 0.35)
+
+# OCR settings per interaction type - these are part of the cache key too
+# psm 4 = one column of text (the likes/comments lists), psm 3 = tesseract's default full page.
+# a likes list is nothing but handles, display names and "Follow" so it can be limited to
+# handle characters; an 'engine' key here overrides OCR_ENGINE for that type.
+# 'preprocess' overrides preprocess.DEFAULT_PREPROCESS ({'enabled': False} = raw screenshot).
+# tags only lose the status bar by default - TAG_HEADER is much less to OCR, but mentions
+# further down a DM thread wouldn't get counted anymore
+OCR_PROFILES = {
+    'likes': {'lang': 'eng', 'psm': 4, 'whitelist': HANDLE_CHARS, 'preprocess': {'crop': LIKES_USERNAME_COLUMN}},
+    'comments': {'lang': 'eng', 'psm': 4, 'whitelist': None, 'preprocess': {'crop': BELOW_STATUS_BAR}},
+    'tags': {'lang': 'eng', 'psm': 3, 'whitelist': None, 'preprocess': {'crop': BELOW_STATUS_BAR}}
+}
+DEFAULT_OCR_PROFILE = {'lang': 'eng', 'psm': 3, 'whitelist': None}
+
+# duplicate screenshots - for the same post + type on the same day, the exact same file or one whose
+# dHash is within this many bits of an earlier upload is turned away before OCR. near-copies only
+# provisionally: the rejection lists the usernames the earlier one matched and the uploader
+# confirms with allow_duplicate if it's really a different screenshot (see dedupe.py).
+# 8 bits covers every re-saved/rescaled copy the benchmark screenshots produced (max 5).
+# tags only get checked with a post URL: without one every tag upload shares a single bucket and
+# a member's second mention of the day can look just like their first
+# the index is in memory, so with several sqlite workers each one only knows its own uploads
+DUPLICATE_CHECK = True
+DUPLICATE_MAX_DISTANCE = 8
+
+# metrics for /api/metrics
+STAGE_SECONDS = metrics.Histogram(
+    'ig_screenshot_stage_seconds', 'Time spent in each stage of the screenshot pipeline', ['stage'])
+SCREENSHOTS_PROCESSED = metrics.Counter(
+    'ig_screenshots_processed_total', 'Screenshots run through the pipeline', ['type'])
+USERNAME_MATCHES = metrics.Counter(
+    'ig_username_matches_total', 'Roster members matched in screenshots', ['type'])
+TAG_OCCURRENCES = metrics.Counter(
+    'ig_tag_occurrences_total', 'Story mentions + post tags detected in screenshots')
+DUPLICATES_REJECTED = metrics.Counter(
+    'ig_duplicate_screenshots_total', 'Screenshots turned away as near-duplicates of an earlier upload', ['type'])
+OCR_PIXELS = metrics.Counter(
+    'ig_ocr_pixels_total', 'Screenshot pixels before preprocessing vs what OCR actually got', ['image'])
+OCR_CACHE_LOOKUPS = metrics.Counter(
+    'ig_ocr_cache_lookups_total', 'OCR cache lookups', ['result'])
+ERRORS = metrics.Counter(
+    'ig_errors_total', 'Unhandled errors', ['where'])
+
+# how often the interaction log gets folded back into the snapshot
+# the interaction history is only loaded when something first needs it (leaderboard date
+# ranges, analytics, the history list, any upload/undo) - startup just reads the roster etc.
+# preloading starts that right away in the background so it's usually done before anyone asks
+PRELOAD_INTERACTIONS = True
+
+COMPACTION_INTERVAL_SECONDS = 300
+COMPACTION_MIN_EVENTS = 200
+FLUSH_INTERVAL_SECONDS = 1.0  # how often dirty roster/activity files get written out
+
+# paging + compression for API responses
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+COMPRESS_MIN_BYTES = 1024  # smaller responses aren't worth compressing
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv')
+RESPONSE_CACHE_SIZE = 256  # cached GET responses (different date ranges count separately)
 
 # stores all the data in memory while app is running
 roster = []
-interactions = []
+roster_index = {}  # username -> member dict in roster, for O(1) lookups
+leaderboard = Leaderboard()  # roster kept in points order, updated as points change
+interactions = []  # empty until ensure_interactions_loaded() - see PRELOAD_INTERACTIONS
+interactions_loaded = threading.Event()
+interactions_load_lock = threading.Lock()
+snapshot_history = None  # (offset, log seq, file fingerprint) of the history in STATE_SNAPSHOT_FILE, when it's still current
+db_history_version = None  # with sqlite, the database version the loaded history is current as of
+daily_points = {}  # 'YYYY-MM-DD' -> {username: [likes, comments, tags, total_points]}
+daily_cumulative = None  # prefix sums over daily_points, rebuilt lazily after changes
+activity_heatmap = [[0] * 24 for _ in range(7)]  # [weekday][hour] -> members active
 credentials = {}
-undo_stack = []  # stores recent actions for undo functionality
+undo_stack = []  # stores recent actions for undo functionality (with sqlite they're in the database)
 last_activity = {}  # tracks last upload info
+jobs = {}  # queued/running/finished screenshot jobs by id (run here - with sqlite every worker's are in the database too)
+job_executor = None  # background worker pool for jobs, created on first use
+jobs_lock = threading.Lock()
+# every read of roster/interactions/undo_stack/etc goes through state_lock.read(),
+# every change through state_write() - so the app is safe under a threaded server
+state_lock = ReadWriteLock()
+interaction_log_lock = threading.Lock()  # guards appends to the interaction log
+interaction_log_seq = 0  # sequence number of the last logged interaction event
+dirty_files = set()  # files waiting for the background flush ('roster', 'activity')
+dirty_lock = threading.Lock()
+# held by the flush, compaction and snapshot saves from rendering the data to the final replace,
+# so one of them can never put an older render on disk after another wrote a newer one
+# (always taken before state_lock, never while holding it)
+file_write_lock = threading.RLock()
+data_version = 0  # goes up on every change - used for ETags + the response cache
+boot_id = uuid.uuid4().hex[:8]
+response_cache = {}  # (path, query string) -> (data version, serialized JSON)
+screenshot_hashes = dedupe.ScreenshotHashIndex(max_distance=DUPLICATE_MAX_DISTANCE)
+db = None  # the SQLiteStore when STORAGE_BACKEND is 'sqlite' - opened by start()
+started = False
+start_lock = threading.Lock()
 
-# loads everything from files when app starts up
+# loads everything when app starts up (or when another worker changed the database)
 def load_data():
-    global roster, interactions, credentials, last_activity
-    
+    global roster, credentials, data_version
+    data_version += 1
+    unload_interactions()
+    if db is None:
+        load_data_from_files()
+        return
+
+    roster, credentials, loaded_activity = db.load_state()
+    last_activity.clear()
+    last_activity.update(loaded_activity)
+    rebuild_roster_index()
+
+# first start on sqlite - copy whatever the CSV/JSON files had into the database
+# several workers can get here at once on a fresh database, so the emptiness check is redone
+# inside the write transaction - only the first one in imports, the rest see its rows
+def migrate_files_to_sqlite():
+    load_data_from_files()
+    history = load_interactions()
+    with db.transaction():
+        if not db.is_empty():
+            return
+        db.save_roster(roster)
+        db.add_interactions(history)
+        db.save_setting('credentials', credentials)
+        db.save_setting('last_activity', last_activity)
+    logger.info("migrated files to sqlite members=%d interactions=%d db=%s", len(roster), len(history), SQLITE_FILE)
+
+# loads everything but the interaction history from the CSV/JSON files - or from the
+# binary snapshot for every file that hasn't changed since the snapshot was written
+def load_data_from_files():
+    global roster, credentials, snapshot_history
+    snapshot, history_offset, snapshot_fingerprint = state_snapshot.read_state(STATE_SNAPSHOT_FILE)
+
+    def unchanged(path):
+        return snapshot is not None and path in snapshot['sources'] and \
+            snapshot['sources'][path] == state_snapshot.fingerprint(path)
+
     # load login credentials if they exist
-    if os.path.exists(CREDENTIALS_FILE):
+    if unchanged(CREDENTIALS_FILE):
+        credentials = snapshot['credentials']
+    elif os.path.exists(CREDENTIALS_FILE):
         with open(CREDENTIALS_FILE, 'r') as f:
             credentials = json.load(f)
     
     # load the member roster from CSV
-    if os.path.exists(ROSTER_FILE):
+    if unchanged(ROSTER_FILE):
+        roster = snapshot['roster']
+        rebuild_roster_index()
+    elif os.path.exists(ROSTER_FILE):
         with open(ROSTER_FILE, 'r') as f:
             csv_reader = csv.DictReader(f)
             roster = []
@@ -72,54 +251,701 @@ def load_data():
                     'total_points': int(row.get('total_points', 0))
                 }
                 roster.append(member)
+            rebuild_roster_index()
 
-    # load all the interaction history
-    if os.path.exists(INTERACTIONS_FILE):
-        with open(INTERACTIONS_FILE, 'r') as f:
-            interactions = json.load(f)
+    # the interaction history waits for ensure_interactions_loaded()
+    if unchanged(INTERACTIONS_FILE):
+        snapshot_history = (history_offset, snapshot['log_seq'], snapshot_fingerprint)
     
     # load last activity
-    if os.path.exists(ACTIVITY_FILE):
+    if unchanged(ACTIVITY_FILE):
+        last_activity.update(snapshot['last_activity'])
+    elif os.path.exists(ACTIVITY_FILE):
         with open(ACTIVITY_FILE, 'r') as f:
             last_activity.update(json.load(f))
 
+# loads the interaction history + its stats the first time anything needs them
+# (safe to call with state_lock held either way - loading never waits on state_lock)
+def ensure_interactions_loaded():
+    global daily_cumulative, db_history_version
+    if interactions_loaded.is_set():
+        return
+    with interactions_load_lock:
+        if interactions_loaded.is_set():
+            return
+        started = time.perf_counter()
+        history = load_snapshot_history() if db is None else None
+        if history is not None:
+            interactions[:] = history['interactions']
+        elif db is not None:
+            db_history_version, interactions[:] = db.load_interactions()
+        else:
+            interactions[:] = load_interactions()
+
+        if history is not None and history['daily_points'] is not None:
+            daily_points.clear()
+            daily_points.update(history['daily_points'])
+            activity_heatmap[:] = history['heatmap']
+            daily_cumulative = None
+        else:
+            rebuild_interaction_stats()
+        interactions_loaded.set()
+        logger.info("loaded interaction history interactions=%d source=%s seconds=%.3f", len(interactions),
+                    'snapshot' if history is not None else 'sqlite' if db is not None else 'json',
+                    time.perf_counter() - started)
+
+# forgets the loaded history, so the next ensure_interactions_loaded() reads it again
+def unload_interactions():
+    global snapshot_history
+    with interactions_load_lock:
+        interactions_loaded.clear()
+        interactions.clear()
+        snapshot_history = None
+        rebuild_interaction_stats()  # back to empty tables
+
+# history from the binary snapshot + anything logged after it, or None to fall back to the JSON
+# (the stats in the snapshot are only reused if nothing got logged since)
+def load_snapshot_history():
+    global interaction_log_seq
+    if snapshot_history is None:
+        return None
+    offset, snapshot_seq, snapshot_fingerprint = snapshot_history
+    history = state_snapshot.read_history(STATE_SNAPSHOT_FILE, offset, snapshot_fingerprint)
+    if history is None:
+        return None
+    interaction_log_seq = snapshot_seq
+    if replay_interaction_log(history['interactions'], snapshot_seq):
+        history['daily_points'] = history['heatmap'] = None  # stale now - rebuilt from the list
+    return history
+
+# rebuilds the username -> member lookup and the ranking after the roster list changes
+# (first entry wins if a username shows up twice, same as the old linear scan)
+def rebuild_roster_index():
+    roster_index.clear()
+    for member in roster:
+        roster_index.setdefault(member['username'], member)
+    leaderboard.rebuild(roster)
+
+# adds (sign=1) or removes (sign=-1) one interaction from the per-day points table
+# scored the same way the date-range leaderboard always has (tags = 1 tag / 5 pts per interaction)
+def add_to_daily_points(interaction, sign=1):
+    global daily_cumulative
+    day = daily_points.setdefault(interaction['timestamp'][:10], {})  # YYYY-MM-DD
+    interaction_type = interaction['type']
+    matched_usernames = interaction['usernames']
+    comment_counts = Counter(matched_usernames)
+
+    for username in matched_usernames:
+        counts = day.setdefault(username, [0, 0, 0, 0])  # likes, comments, tags, total_points
+        if interaction_type == 'likes':
+            counts[0] += sign
+            counts[3] += sign * POINTS['likers']
+        elif interaction_type == 'comments':
+            count = comment_counts[username]
+            counts[1] += sign * count
+            counts[3] += sign * min(count, MAX_POINTS_PER_COMMENT) * POINTS['commenters']
+        elif interaction_type == 'tags':
+            counts[2] += sign
+            counts[3] += sign * POINTS['tagged_users']
+
+    daily_cumulative = None  # running sums are stale now
+
+# adds/removes one interaction's activity in the weekday x hour heatmap
+# placed by when it was uploaded - a screenshot date has no time of day, and pairing its
+# weekday with the upload's hour would be a moment that never happened
+def add_to_heatmap(interaction, sign=1):
+    timestamp = interaction.get('uploadedAt')
+    if timestamp is None:
+        timestamp = interaction['timestamp']
+        if timestamp[10:] == 'T12:00:00':
+            return  # older screenshot-dated interaction from before uploadedAt - no real time at all
+    try:
+        weekday = datetime.fromisoformat(timestamp[:10]).weekday()  # Monday = 0
+        hour = int(timestamp[11:13])
+    except ValueError:
+        return
+    activity_heatmap[weekday][hour] += sign * len(interaction['usernames'])
+
+# keeps every precomputed stat in step when an interaction is added (1) or undone (-1)
+def track_interaction(interaction, sign=1):
+    add_to_daily_points(interaction, sign)
+    add_to_heatmap(interaction, sign)
+
+# builds the per-day table + heatmap from scratch (startup / reset)
+def rebuild_interaction_stats():
+    global daily_cumulative
+    daily_points.clear()
+    daily_cumulative = None
+    for row in activity_heatmap:
+        row[:] = [0] * 24
+    for interaction in interactions:
+        track_interaction(interaction)
+
+# running totals per member across the sorted days, so any date range is just end - start
+# built lazily on the first date-filtered request after something changed
+# (two readers may both build it at once - they build the same table, so that's fine)
+def get_daily_cumulative():
+    global daily_cumulative
+    ensure_interactions_loaded()
+    if daily_cumulative is None:
+        days = sorted(daily_points)
+        totals = {}  # username -> [[likes, comments, tags, total_points] before day 0, after day 0, ...]
+        for idx, day in enumerate(days):
+            for username, counts in daily_points[day].items():
+                if username not in totals:
+                    totals[username] = [[0, 0, 0, 0]] * (idx + 1)
+                running = totals[username]
+                # pad out days where this member had nothing
+                while len(running) < idx + 1:
+                    running.append(running[-1])
+                last = running[-1]
+                running.append([last[i] + counts[i] for i in range(4)])
+        for running in totals.values():
+            while len(running) < len(days) + 1:
+                running.append(running[-1])
+        daily_cumulative = {'days': days, 'totals': totals}
+    return daily_cumulative
+
+# likes/comments/tags/points per member for interactions dated start_date..end_date (inclusive)
+def points_in_range(start_date=None, end_date=None):
+    cumulative = get_daily_cumulative()
+    days = cumulative['days']
+    start_idx = bisect.bisect_left(days, start_date) if start_date else 0
+    end_idx = bisect.bisect_right(days, end_date) if end_date else len(days)
+    end_idx = max(end_idx, start_idx)
+
+    ranged = {}
+    for username, running in cumulative['totals'].items():
+        after, before = running[end_idx], running[start_idx]
+        ranged[username] = [after[i] - before[i] for i in range(4)]
+    return ranged
+
+# writes a whole file atomically (see atomicfile.py)
+def atomic_write(path, text):
+    with atomic_open(path, 'w', newline='') as f:
+        f.write(text)
+
+def render_credentials():
+    return json.dumps(credentials, indent=2)
+
+def render_roster():
+    output = io.StringIO()
+    fieldnames = ['First Name', 'Last Name', 'Username', 'likes', 'comments', 'tags', 'total_points']
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    for member in roster:
+        writer.writerow({
+            'First Name': member['first_name'],
+            'Last Name': member['last_name'],
+            'Username': member['username'],
+            'likes': member['likes'],
+            'comments': member['comments'],
+            'tags': member['tags'],
+            'total_points': member['total_points']
+        })
+    return output.getvalue()
+
+def render_activity():
+    return json.dumps(last_activity, indent=2)
+
 # saves login info
 def save_credentials():
-    with open(CREDENTIALS_FILE, 'w') as f:
-        json.dump(credentials, f, indent=2)
+    if db is not None:
+        db.save_setting('credentials', credentials)
+        return
+    atomic_write(CREDENTIALS_FILE, render_credentials())
     
-# saves roster back to CSV file
-def save_roster():
+# saves roster back to CSV file - with sqlite, members= means only those rows changed
+def save_roster(members=None):
     if not roster:
         return
-    
-    with open(ROSTER_FILE, 'w', newline='') as f:
-        fieldnames = ['First Name', 'Last Name', 'Username', 'likes', 'comments', 'tags', 'total_points']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for member in roster:
-            writer.writerow({
-                'First Name': member['first_name'],
-                'Last Name': member['last_name'],
-                'Username': member['username'],
-                'likes': member['likes'],
-                'comments': member['comments'],
-                'tags': member['tags'],
-                'total_points': member['total_points']
-            })
+    if db is not None:
+        if members is not None:
+            db.save_members(members)
+        else:
+            db.save_roster(roster)
+        return
+    atomic_write(ROSTER_FILE, render_roster())
+
+# interactions are stored as a snapshot (INTERACTIONS_FILE) plus an append-only log of
+# everything that happened after it (INTERACTIONS_LOG_FILE, one JSON event per line).
+# every event gets a sequence number and the snapshot remembers the last one it includes,
+# so replaying after a crash mid-compaction never applies an event twice
+def load_interactions():
+    global interaction_log_seq
+    loaded = []
+    snapshot_seq = 0
+    if os.path.exists(INTERACTIONS_FILE):
+        with open(INTERACTIONS_FILE, 'r') as f:
+            snapshot = json.load(f)
+        # older snapshots are just the plain list
+        if isinstance(snapshot, list):
+            loaded = snapshot
+        else:
+            loaded = snapshot['interactions']
+            snapshot_seq = snapshot.get('log_seq', 0)
+
+    interaction_log_seq = snapshot_seq
+    replay_interaction_log(loaded, snapshot_seq)
+    return loaded
+
+# applies every logged event after snapshot_seq to target - returns how many there were
+def replay_interaction_log(target, snapshot_seq):
+    global interaction_log_seq
+    replayed = 0
+    if os.path.exists(INTERACTIONS_LOG_FILE):
+        with open(INTERACTIONS_LOG_FILE, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # damaged line (a crash mid-write) - skip just that one, the rest still count
+                    logger.warning("skipping unreadable interaction log line: %.80s", line)
+                    continue
+                if event['seq'] <= snapshot_seq:
+                    continue
+                replay_interaction_event(target, event)
+                interaction_log_seq = event['seq']
+                replayed += 1
+    return replayed
+
+# applies one logged event to a list of interactions
+def replay_interaction_event(target, event):
+    if event['op'] == 'add':
+        target.append(event['interaction'])
+    elif event['op'] == 'remove':
+        for removed in event['interactions']:
+            remove_interaction(target, removed)
+    elif event['op'] == 'clear':
+        target.clear()
 
-# saves all the interactions we've processed
+# takes one interaction out of a list by id - undo only ever removes recent ones, so search
+# backwards from the end like undo_action does (interactions from before ids existed get
+# compared whole)
+def remove_interaction(target, removed):
+    removed_id = removed.get('id')
+    for idx in range(len(target) - 1, -1, -1):
+        if (target[idx].get('id') == removed_id) if removed_id else target[idx] == removed:
+            del target[idx]
+            return
+
+# a crash mid-append can leave half a line at the end of the log - cut it back to the last
+# full line at startup, before anything gets appended and glued onto the broken one
+def repair_interaction_log():
+    try:
+        f = open(INTERACTIONS_LOG_FILE, 'rb+')
+    except FileNotFoundError:
+        return
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        # walk back a block at a time until we find the last newline
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end == size:
+            return
+        f.seek(end)
+        try:
+            json.loads(f.read(size - end))
+            f.write(b'\n')  # the whole event made it, only the newline didn't
+        except ValueError:
+            f.truncate(end)
+            logger.warning("dropped %d bytes of half-written interaction log", size - end)
+
+# the log lines after seq, skipping any that can't be read
+def log_lines_after(lines, seq):
+    kept = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            if json.loads(line)['seq'] > seq:
+                kept.append(line)
+        except (ValueError, KeyError, TypeError):
+            logger.warning("dropping unreadable interaction log line: %.80s", line)
+    return kept
+
+# appends events to the log - one short line per event no matter how big the history is
+def log_interaction_events(events):
+    global interaction_log_seq
+    if db is not None:
+        with db.transaction():
+            for event in events:
+                if event['op'] == 'add':
+                    db.add_interactions([event['interaction']])
+                elif event['op'] == 'remove':
+                    db.remove_interactions([interaction['id'] for interaction in event['interactions']])
+                elif event['op'] == 'clear':
+                    db.clear_interactions()
+        return
+    with interaction_log_lock:
+        with open(INTERACTIONS_LOG_FILE, 'a') as f:
+            for event in events:
+                interaction_log_seq += 1
+                f.write(json.dumps({'seq': interaction_log_seq, **event}) + '\n')
+            f.flush()
+
+def log_added_interactions(added):
+    log_interaction_events([{'op': 'add', 'interaction': interaction} for interaction in added])
+
+# saves all the interactions we've processed as a fresh snapshot, then drops the log
+# lines the snapshot now covers
 def save_interactions():
-    with open(INTERACTIONS_FILE, 'w') as f:
-        json.dump(interactions, f, indent=2)
+    if db is not None:
+        return  # the database is always up to date, nothing to compact
+    ensure_interactions_loaded()  # never snapshot the empty not-loaded-yet list
+    with file_write_lock:
+        # grab a consistent copy - every change to interactions + its log line happen under state_lock
+        with state_lock.read():
+            with interaction_log_lock:
+                snapshot = {'log_seq': interaction_log_seq, 'interactions': list(interactions)}
+
+        with atomic_open(INTERACTIONS_FILE, 'w') as f:
+            json.dump(snapshot, f, indent=2)
+
+        # keep only events that came in while we were writing the snapshot
+        with interaction_log_lock:
+            if os.path.exists(INTERACTIONS_LOG_FILE):
+                with open(INTERACTIONS_LOG_FILE, 'r') as f:
+                    tail = log_lines_after(f, snapshot['log_seq'])
+                with atomic_open(INTERACTIONS_LOG_FILE, 'w') as f:
+                    f.writelines(tail)
+
+        save_state_snapshot()
+
+# writes the binary snapshot for the next startup. the roster + activity files get written
+# out here too, from the same copy of the data, so their fingerprints match what's in it.
+# only the copy happens under state_lock - pickling the whole history takes long enough
+# that uploads would stall behind it otherwise (file_write_lock keeps other saves out meanwhile)
+def save_state_snapshot():
+    if db is not None:
+        return  # sqlite starts fast on its own
+    ensure_interactions_loaded()
+    with file_write_lock, STAGE_SECONDS.time(stage='snapshot'):
+        with state_lock.read():
+            with dirty_lock:
+                dirty_files.clear()
+            roster_text = render_roster() if roster else None
+            activity_text = render_activity()
+            with interaction_log_lock:
+                log_seq = interaction_log_seq
+            # credentials get saved straight from the request, without file_write_lock
+            sources = {path: state_snapshot.fingerprint(path) for path in (CREDENTIALS_FILE, INTERACTIONS_FILE)}
+            # interactions never change once they're in the list, everything else gets
+            # updated in place so it needs its own copy
+            state = {
+                'credentials': dict(credentials),
+                'roster': [dict(member) for member in roster],
+                'last_activity': dict(last_activity),
+                'log_seq': log_seq
+            }
+            history = {
+                'interactions': list(interactions),
+                'daily_points': {day: {username: counts[:] for username, counts in points.items()}
+                                 for day, points in daily_points.items()},
+                'heatmap': [row[:] for row in activity_heatmap]
+            }
+
+        if roster_text is not None:  # an empty roster never overwrites the CSV, so it always gets read from there
+            atomic_write(ROSTER_FILE, roster_text)
+            sources[ROSTER_FILE] = state_snapshot.fingerprint(ROSTER_FILE)
+        atomic_write(ACTIVITY_FILE, activity_text)
+        sources[ACTIVITY_FILE] = state_snapshot.fingerprint(ACTIVITY_FILE)
+        state['sources'] = sources
+        state_snapshot.write(STATE_SNAPSHOT_FILE, state, history)
+
+# clean shutdown - write everything out, plus a snapshot so the next start is quick
+# (skipped if the history never got loaded: nothing changed, the last snapshot still holds)
+def save_on_exit():
+    flush_dirty()
+    if interactions_loaded.is_set() or snapshot_history is None:
+        save_state_snapshot()
+
+# how many events are sitting in the log since the last snapshot
+def interaction_log_length():
+    if not os.path.exists(INTERACTIONS_LOG_FILE):
+        return 0
+    with open(INTERACTIONS_LOG_FILE, 'rb') as f:
+        return sum(1 for _ in f)
+
+# background thread - folds the log into the snapshot every so often
+def compaction_loop():
+    while True:
+        time.sleep(COMPACTION_INTERVAL_SECONDS)
+        try:
+            if interaction_log_length() >= COMPACTION_MIN_EVENTS:
+                save_interactions()
+                logger.info("compacted interaction log into snapshot")
+        except Exception:
+            logger.exception("compaction failed")
+            ERRORS.inc(where='compaction')
 
 # saves last activity info
 def save_activity():
-    with open(ACTIVITY_FILE, 'w') as f:
-        json.dump(last_activity, f, indent=2)
+    if db is not None:
+        db.save_setting('last_activity', last_activity)
+        return
+    atomic_write(ACTIVITY_FILE, render_activity())
+
+# write-behind saving: request handlers just mark a file dirty and a background thread
+# writes it out every FLUSH_INTERVAL_SECONDS, so a burst of uploads is one write per file
+PERSISTED_FILES = {
+    'roster': (ROSTER_FILE, render_roster),
+    'activity': (ACTIVITY_FILE, render_activity)
+}
 
-# actually load everything when app starts
-load_data()
+# members= (roster only): just these members' points/names changed - with sqlite only their
+# rows get written, the CSV is always written whole
+def schedule_save(name, members=None):
+    # sqlite writes have to land in the current transaction so other workers see them
+    if db is not None:
+        if name == 'roster':
+            save_roster(members)
+        else:
+            save_activity()
+        return
+    with dirty_lock:
+        dirty_files.add(name)
+
+# roster members for a set of usernames (ones deleted since are skipped)
+def roster_members(usernames):
+    return [roster_index[username] for username in usernames if username in roster_index]
+
+# writes out everything that's dirty - the data gets serialized under state_lock
+# (so it's never half-updated) but the disk writes happen after letting go of it
+def flush_dirty():
+    with file_write_lock:
+        with state_lock.read():
+            with dirty_lock:
+                pending = set(dirty_files)
+                dirty_files.clear()
+            rendered = {}
+            for name in pending:
+                if name == 'roster' and not roster:
+                    continue  # never overwrite the CSV with an empty roster
+                path, render = PERSISTED_FILES[name]
+                rendered[name] = (path, render())
+
+        for name, (path, text) in rendered.items():
+            try:
+                with STAGE_SECONDS.time(stage='flush'):
+                    atomic_write(path, text)
+            except OSError:
+                # try again next round
+                with dirty_lock:
+                    dirty_files.add(name)
+                raise
+
+def flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        try:
+            flush_dirty()
+        except Exception:
+            logger.exception("flush failed")
+            ERRORS.inc(where='flush')
+
+# lock for changing the roster/interactions - with sqlite this also holds the database
+# write lock and first picks up anything another worker changed
+# history=False for changes that never touch the interactions (login, roster edits), so
+# those don't wait for the whole history to load after a restart
+@contextmanager
+def state_write(history=True):
+    global data_version
+    with state_lock.write():
+        try:
+            if db is None:
+                if history:
+                    ensure_interactions_loaded()
+                yield
+                return
+            with db.transaction():
+                if db.has_changed():
+                    sync_from_db()
+                if history:
+                    ensure_interactions_loaded()
+                yield
+        finally:
+            data_version += 1  # anything cached for the old data is stale now
+
+# what ETags are built from - with sqlite use the shared database version, so every
+# worker hands out the same tag for the same data
+def current_data_version():
+    if db is not None:
+        return f"db{db.seen_version}"
+    return f"{boot_id}-{data_version}"  # boot id so a restart can't reuse an old tag
+
+# serves a GET from the per-version cache, with ETag / If-None-Match support
+# build() only runs when the data changed since the last time this exact URL was asked for
+def cached_json_response(build):
+    # read lock so the version and the data it labels can't drift apart
+    with state_lock.read():
+        version = current_data_version()
+        etag = f'W/"{version}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        # the client already has this version
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            return Response(status=304, headers=headers)
+
+        key = (request.path, request.query_string)
+        cached = response_cache.get(key)
+        if cached is None or cached[0] != version:
+            if len(response_cache) >= RESPONSE_CACHE_SIZE:
+                response_cache.clear()
+            cached = (version, jsonify(build()).get_data())
+            response_cache[key] = cached
+    return Response(cached[1], mimetype='application/json', headers=headers)
+
+# actually load everything + start the background threads - once per server process
+# this is not done at import: OCR pool workers import this module too (spawn/forkserver
+# re-import the main script), and they must not load data, flush files or save on exit.
+# runs from __main__ below, or on the first request under any other server (gunicorn etc)
+# save_at_exit=False is for tools that run the app in a scratch directory (loadtest.py)
+def start(save_at_exit=True):
+    global db, started
+    if started:
+        return
+    with start_lock:
+        if started:
+            return
+        if STORAGE_BACKEND == 'sqlite':
+            db = SQLiteStore(SQLITE_FILE)
+            if db.is_empty():
+                migrate_files_to_sqlite()
+        else:
+            repair_interaction_log()
+        load_data()
+        if PRELOAD_INTERACTIONS:
+            threading.Thread(target=ensure_interactions_loaded, daemon=True).start()
+        if db is None:
+            threading.Thread(target=compaction_loop, daemon=True).start()
+            threading.Thread(target=flush_loop, daemon=True).start()
+            if save_at_exit:
+                atexit.register(save_on_exit)  # don't lose the last few seconds on a clean shutdown
+        started = True
+
+@app.before_request
+def ensure_started():
+    start()
+
+# catches up on what other workers wrote since we last looked - only the members and
+# interactions they changed, or everything if we're too far behind (see changes in sqlite_store.py)
+# call with state_lock held for writing
+def sync_from_db():
+    global data_version, db_history_version
+    with db.read_snapshot():
+        version, changes = db.changes_since(db.seen_version)
+        if changes is None:
+            load_data()
+            return
+        apply_db_changes(changes)
+        db.mark_seen(version)
+        with interactions_load_lock:
+            if interactions_loaded.is_set():
+                db_history_version = max(db_history_version, version)
+    data_version += 1
+
+def apply_db_changes(changes):
+    global roster, credentials
+    changed_members = set()
+    settings = set()
+    reload_roster = False
+    history_changes = []
+    for version, kind, key in changes:
+        if kind == 'member':
+            changed_members.add(key)
+        elif kind == 'roster':
+            reload_roster = True
+        elif kind == 'setting':
+            settings.add(key)
+        else:
+            history_changes.append((version, kind, key))
+
+    if reload_roster:
+        roster = db.load_roster()
+        rebuild_roster_index()
+    elif changed_members:
+        for row in db.load_members(changed_members):
+            member = roster_index.get(row['username'])
+            if member is None:
+                roster.append(row)
+                roster_index[row['username']] = row
+                leaderboard.add(row)
+            else:
+                member.update(row)
+                leaderboard.update(member)
+
+    if 'credentials' in settings:
+        credentials = db.get_setting('credentials', {})
+    if 'last_activity' in settings:
+        last_activity.clear()
+        last_activity.update(db.get_setting('last_activity', {}))
+
+    # the history only if it's loaded (otherwise it gets read fresh when it is), and only
+    # changes it doesn't already have
+    with interactions_load_lock:
+        if not interactions_loaded.is_set():
+            return
+        history_changes = [change for change in history_changes if change[0] > db_history_version]
+        added = db.load_interactions_by_rowid(int(key) for _, kind, key in history_changes if kind == 'add')
+        for _, kind, key in history_changes:
+            if kind == 'add' and int(key) in added:
+                interaction = added[int(key)]
+                interactions.append(interaction)
+                track_interaction(interaction)
+            elif kind == 'remove':
+                for idx in range(len(interactions) - 1, -1, -1):
+                    if interactions[idx].get('id') == key:
+                        track_interaction(interactions.pop(idx), sign=-1)
+                        break
+            elif kind == 'clear':
+                interactions.clear()
+                rebuild_interaction_stats()
+
+@app.before_request
+def refresh_from_db():
+    if db is not None and db.has_changed():
+        with state_lock.write():
+            if db.has_changed():
+                sync_from_db()
+
+# gzip/brotli big JSON + CSV responses when the browser says it can handle them
+@app.after_request
+def compress_response(response):
+    if response.direct_passthrough or response.is_streamed:
+        return response  # file downloads + server-sent events stay as they are
+    if response.status_code < 200 or response.status_code >= 300 or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+
+    accept_encoding = request.headers.get('Accept-Encoding', '').lower()
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    if brotli is not None and 'br' in accept_encoding:
+        compressed, encoding = brotli.compress(data, quality=5), 'br'
+    elif 'gzip' in accept_encoding:
+        compressed, encoding = gzip.compress(data, compresslevel=6), 'gzip'
+    else:
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(compressed))
+    response.vary.add('Accept-Encoding')
+    return response
 
 # makes sure you're logged in before accessing stuff
 def login_required(f):
@@ -131,15 +957,86 @@ def login_required(f):
     return decorated_function
 
 # fuzzy matching bc instagram usernames are messy
-def fuzzy_match(text, roster_usernames):
-    text_lower = text.lower().strip().replace('@', '')
-    matches = []
+# the roster gets indexed once (length buckets + character bigrams) so each OCR word only
+# runs the full SequenceMatcher ratio against a handful of usernames instead of all of them.
+# every filter below is an upper bound on ratio(), so the results are exactly what a full
+# scan of the roster would give
+class UsernameMatcher:
+    MAX_CACHED_WORDS = 10000  # memoized lookups per roster version (OCR repeats "liked", "Follow" a lot)
+
+    def __init__(self, usernames):
+        self.key = tuple(usernames)  # which roster this index was built for
+        self.usernames = list(usernames)
+        self.lowered = [u.lower() for u in self.usernames]
+        self.by_length = {}  # username length -> roster positions
+        self.bigram_index = {}  # 2-char chunk -> roster positions containing it
+        self.match_cache = {}
+
+        for idx, username in enumerate(self.lowered):
+            self.by_length.setdefault(len(username), []).append(idx)
+            for bigram in {username[i:i + 2] for i in range(len(username) - 1)}:
+                self.bigram_index.setdefault(bigram, []).append(idx)
+
+    # ratio() = 2*matches / (len_a + len_b) can't beat 2*min(len) / (len_a + len_b)
+    @staticmethod
+    def lengths_can_match(len_a, len_b):
+        total = len_a + len_b
+        if total == 0:
+            return True
+        return 2.0 * min(len_a, len_b) / total >= FUZZY_MATCH_THRESHOLD - 1e-9
+
+    def candidates(self, text_lower):
+        text_len = len(text_lower)
 
-    for username in roster_usernames:
-        similarity = SequenceMatcher(None, text_lower, username.lower()).ratio()
-        if similarity >= FUZZY_MATCH_THRESHOLD:
-            matches.append(username)
-    return matches
+        # if two strings share no 2-char chunk every matching block is 1 char long, which
+        # caps ratio() below 0.8 unless both strings together are 5 chars or less - so
+        # for longer words (and a threshold of 0.8+) the bigram index can't miss a match
+        if text_len >= 4 and FUZZY_MATCH_THRESHOLD >= 0.8:
+            positions = set()
+            for i in range(text_len - 1):
+                positions.update(self.bigram_index.get(text_lower[i:i + 2], ()))
+            return sorted(idx for idx in positions if self.lengths_can_match(text_len, len(self.lowered[idx])))
+
+        # short words - just check every username in a compatible length bucket
+        positions = []
+        for length, bucket in self.by_length.items():
+            if self.lengths_can_match(text_len, length):
+                positions.extend(bucket)
+        return sorted(positions)
+
+    def match(self, text):
+        text_lower = text.lower().strip().replace('@', '')
+        if text_lower in self.match_cache:
+            return list(self.match_cache[text_lower])
+
+        matches = []
+        for idx in self.candidates(text_lower):
+            matcher = SequenceMatcher(None, text_lower, self.lowered[idx])
+            # cheap upper bounds first, the real ratio only for whatever survives
+            if matcher.real_quick_ratio() < FUZZY_MATCH_THRESHOLD:
+                continue
+            if matcher.quick_ratio() < FUZZY_MATCH_THRESHOLD:
+                continue
+            if matcher.ratio() >= FUZZY_MATCH_THRESHOLD:
+                matches.append(self.usernames[idx])
+
+        if len(self.match_cache) >= self.MAX_CACHED_WORDS:
+            self.match_cache.clear()
+        self.match_cache[text_lower] = matches
+        return list(matches)
+
+# rebuilt only when the list of usernames actually changes
+username_matcher = None
+
+def get_username_matcher(roster_usernames):
+    global username_matcher
+    roster_usernames = tuple(roster_usernames)
+    if username_matcher is None or username_matcher.key != roster_usernames:
+        username_matcher = UsernameMatcher(roster_usernames)
+    return username_matcher
+
+def fuzzy_match(text, roster_usernames):
+    return get_username_matcher(roster_usernames).match(text)
 
 # main page - redirects to login if you're not logged in
 @app.route('/')
@@ -168,17 +1065,28 @@ def api_login():
     if not username or not password:
         return jsonify({'success': False, 'error': "Username and password pretty please."}), 400
 
-    # first time using the app? create an account
-    if not credentials:
-        credentials['username'] = username
-        credentials['password_hash'] = generate_password_hash(password)
-        save_credentials()
-        session['logged_in'] = True
-        session['username'] = username
-        return jsonify({'success': True, 'message': "Account created and logged in!"})
+    # a normal login only reads the credentials - the (slow on purpose) hash check runs on a copy
+    with state_lock.read():
+        account = dict(credentials)
+
+    # first time using the app? create an account - the only login that needs the write lock
+    # (re-checked under it, two first logins at once only create one account)
+    if not account:
+        password_hash = generate_password_hash(password)
+        with state_write(history=False):
+            created = not credentials
+            if created:
+                credentials['username'] = username
+                credentials['password_hash'] = password_hash
+                save_credentials()
+            account = dict(credentials)
+        if created:
+            session['logged_in'] = True
+            session['username'] = username
+            return jsonify({'success': True, 'message': "Account created and logged in!"})
     
     # verify login for existing account
-    if credentials['username'] == username and check_password_hash(credentials['password_hash'], password):
+    if account['username'] == username and check_password_hash(account['password_hash'], password):
         session['logged_in'] = True
         session['username'] = username
         return jsonify({'success': True})
@@ -199,18 +1107,19 @@ def change_password():
     old_password = data.get('old_password')
     new_password = data.get('new_password')
 
-    if not check_password_hash(credentials['password_hash'], old_password):
-        return jsonify({'success': False, 'error': 'Incorrect current password'}), 401
+    with state_write(history=False):
+        if not check_password_hash(credentials['password_hash'], old_password):
+            return jsonify({'success': False, 'error': 'Incorrect current password'}), 401
 
-    credentials['password_hash'] = generate_password_hash(new_password)
-    save_credentials()
+        credentials['password_hash'] = generate_password_hash(new_password)
+        save_credentials()
     return jsonify({'success': True, 'message': 'Password updated successfully'})
 
 # get the full roster
 @app.route('/api/roster', methods=['GET'])
 @login_required
 def get_roster():
-    return jsonify(roster)
+    return cached_json_response(lambda: roster)
 
 # add a single member manually
 @app.route('/api/roster/add', methods=['POST'])
@@ -226,21 +1135,91 @@ def add_member():
         'tags': 0,
         'total_points': 0
     }
-    roster.append(member)
-    save_roster()
+    with state_write(history=False):
+        roster.append(member)
+        roster_index.setdefault(member['username'], member)
+        leaderboard.add(member)
+        schedule_save('roster', roster_members([member['username']]))
     return jsonify({'success': True})
 
 # delete a member
 @app.route('/api/roster/delete/<int:index>', methods=['DELETE'])
 @login_required
 def delete_member(index):
-    if 0 <= index < len(roster):
-        roster.pop(index)
-        save_roster()
-        return jsonify({'success': True})
+    with state_write(history=False):
+        if 0 <= index < len(roster):
+            roster.pop(index)
+            rebuild_roster_index()
+            schedule_save('roster')
+            return jsonify({'success': True})
     return jsonify({'success': False}), 400
 
+# instagram usernames are letters, numbers, periods and underscores, 30 chars max
+USERNAME_PATTERN = re.compile(r'[a-z0-9._]{1,30}')
+MAX_IMPORT_ERRORS = 50  # row errors reported back for a rejected roster upload
+DIFF_LIST_LIMIT = 100  # usernames listed per group in the upload summary (counts are always exact)
+
+# parses an uploaded roster CSV row by row straight off the upload stream
+# returns ({username: member}, errors, blank rows skipped) - nothing is applied here
+def parse_roster_csv(binary_stream):
+    # utf-8-sig drops the BOM excel likes to put at the start
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    csv_reader = csv.DictReader(text_stream)
+
+    parsed = {}
+    errors = []
+    skipped = 0
+    for line_number, row in enumerate(csv_reader, start=2):  # line 1 is the header
+        # handles both "First Name" and "first_name" style headers
+        username = (row.get('Username') or row.get('username') or '').lower().strip().replace('@', '')
+
+        # skip rows with empty username
+        if not username:
+            skipped += 1
+            continue
+
+        if not USERNAME_PATTERN.fullmatch(username):
+            errors.append(f"line {line_number}: '{username}' is not a valid instagram username")
+            continue
+        if username in parsed:
+            errors.append(f"line {line_number}: '{username}' is listed more than once")
+            continue
+
+        member = {
+            'first_name': (row.get('First Name') or row.get('first_name') or '').strip(),
+            'last_name': (row.get('Last Name') or row.get('last_name') or '').strip(),
+            'username': username
+        }
+        try:
+            for field in ('likes', 'comments', 'tags', 'total_points'):
+                member[field] = int(row.get(field) or 0)
+        except ValueError:
+            errors.append(f"line {line_number}: '{username}' has a non-numeric point column")
+            continue
+        parsed[username] = member
+
+    text_stream.detach()
+    return parsed, errors, skipped
+
+# appends removed members (with their points) to the archive so nothing is ever lost
+def archive_members(members):
+    archived_at = datetime.now().isoformat()
+    rows = [dict(member, archived_at=archived_at) for member in members]
+    if db is not None:
+        db.save_setting('roster_archive', db.get_setting('roster_archive', []) + rows)
+        return
+
+    fieldnames = ['first_name', 'last_name', 'username', 'likes', 'comments', 'tags', 'total_points', 'archived_at']
+    write_header = not os.path.exists(ROSTER_ARCHIVE_FILE)
+    with open(ROSTER_ARCHIVE_FILE, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        if write_header:
+            writer.writeheader()
+        writer.writerows(rows)
+
 # upload entire roster from CSV file - way easier than adding one by one
+# merges by username: people already on the roster keep their points (names get updated),
+# new people are added, and people missing from the file stay unless archive_missing is set
 @app.route('/api/roster/upload', methods=['POST'])
 @login_required
 def upload_roster():
@@ -251,47 +1230,258 @@ def upload_roster():
         file = request.files['file']
         if file.filename == '':
             return jsonify({'success': False, 'error': 'No file selected'}), 400
-        
-        # read the CSV
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
-        new_roster = []
-        for row in csv_reader:
-            # handles both "First Name" and "first_name" style headers
-            username = row.get('Username', row.get('username', '')).lower().strip().replace('@', '')
-            first_name = row.get('First Name', row.get('first_name', ''))
-            last_name = row.get('Last Name', row.get('last_name', ''))
-            
-            # skip rows with empty username
-            if not username:
-                continue
-                
-            member = {
-                'first_name': first_name,
-                'last_name': last_name,
-                'username': username,
-                'likes': int(row.get('likes', 0)),
-                'comments': int(row.get('comments', 0)),
-                'tags': int(row.get('tags', 0)),
-                'total_points': int(row.get('total_points', 0))
+
+        archive_missing = request.form.get('archive_missing', '').lower() in ('1', 'true', 'on', 'yes')
+
+        parsed, errors, skipped = parse_roster_csv(file.stream)
+        # all or nothing - a half-imported roster is worse than none
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': f'{len(errors)} invalid row(s), nothing was imported',
+                'errors': errors[:MAX_IMPORT_ERRORS]
+            }), 400
+        if not parsed:
+            return jsonify({'success': False, 'error': 'No members found in the CSV'}), 400
+
+        added, updated, missing = [], [], []
+        unchanged = 0
+        with state_write(history=False):
+            for username, row in parsed.items():
+                member = roster_index.get(username)
+                if member is None:
+                    roster.append(row)
+                    added.append(username)
+                    continue
+                names = {k: row[k] for k in ('first_name', 'last_name') if row[k] and row[k] != member[k]}
+                if names:
+                    member.update(names)
+                    updated.append(username)
+                else:
+                    unchanged += 1
+
+            missing = [member for member in roster if member['username'] not in parsed]
+            if archive_missing and missing:
+                archive_members(missing)
+                roster[:] = [member for member in roster if member['username'] in parsed]
+
+            rebuild_roster_index()
+            schedule_save('roster')
+
+        return jsonify({
+            'success': True,
+            'count': len(roster),
+            'added': len(added),
+            'updated': len(updated),
+            'unchanged': unchanged,
+            'missing': len(missing),
+            'archived': len(missing) if archive_missing else 0,
+            'skipped_blank': skipped,
+            'changes': {
+                'added': added[:DIFF_LIST_LIMIT],
+                'updated': updated[:DIFF_LIST_LIMIT],
+                'missing': [member['username'] for member in missing[:DIFF_LIST_LIMIT]]
             }
-            new_roster.append(member)
-        
-        # replace old roster with new one
-        roster.clear()
-        roster.extend(new_roster)
-        save_roster()
-        
-        return jsonify({'success': True, 'count': len(roster)})
+        })
     
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
-        print(f"Upload error: {error_details}")  # Log to console for debugging
+        logger.error("roster upload failed\n%s", error_details)
+        ERRORS.inc(where='roster_upload')
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def ocr_profile(interaction_type):
+    profile = dict(OCR_PROFILES.get(interaction_type, DEFAULT_OCR_PROFILE))
+    profile['engine'] = ocr_engine.resolve_engine_name(profile.get('engine', OCR_ENGINE))
+    profile['preprocess'] = {**preprocess.DEFAULT_PREPROCESS, **profile.get('preprocess', {})}
+    return profile
+
+def record_ocr_timings(timings):
+    OCR_CACHE_LOOKUPS.inc(result='hit' if timings['cache_hit'] else 'miss')
+    if not timings['cache_hit']:
+        STAGE_SECONDS.observe(timings['decode'], stage='decode')
+        STAGE_SECONDS.observe(timings['preprocess'], stage='preprocess')
+        STAGE_SECONDS.observe(timings['ocr'], stage='ocr')
+        OCR_PIXELS.inc(timings['original_pixels'], image='original')
+        OCR_PIXELS.inc(timings['ocr_pixels'], image='sent_to_ocr')
+
+def ocr_image_bytes(image_bytes, interaction_type=None):
+    text, timings = ocr_worker.run_ocr(image_bytes, ocr_profile(interaction_type), OCR_CACHE_DIR)
+    record_ocr_timings(timings)
+    return text
+
+# process pool for batch OCR - only spun up the first time someone uses the batch endpoint
+# workers start fresh (forkserver, or spawn where there's no forkserver) instead of being forked
+# from a process that's already running the flush/compaction/job threads - they only import
+# ocr_worker + dedupe, which do nothing at import
+ocr_pool = None
+
+def get_ocr_pool():
+    global ocr_pool
+    if ocr_pool is None:
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        ocr_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context(method))
+    return ocr_pool
+
+# pulls the date, tag count and candidate usernames out of the OCR text (see ocr_parser.py)
+def extract_screenshot_info(text, interaction_type, manual_username=''):
+    info = parse_screenshot_text(text, interaction_type, manual_username)
+    logger.debug("story_mentions=%d post_tags=%d date=%s potential usernames=%s",
+                 info['story_mentions'], info['post_tags'], info['extracted_date'], info['potential_usernames'])
+    return info
+
+# match against our actual roster using fuzzy matching
+def match_usernames(potential_usernames):
+    roster_usernames = [m['username'] for m in roster]
+    matched_usernames = []
+
+    for potential in potential_usernames:
+        matches = fuzzy_match(potential, roster_usernames)
+        matched_usernames.extend(matches)
+
+    # remove duplicates but keep order
+    matched_usernames = list(dict.fromkeys(matched_usernames))
+
+    logger.debug("matched usernames=%s", matched_usernames)
+    return matched_usernames
+
+# logs the interaction and hands out points - caller is responsible for saving
+# if a deltas dict is passed in, what each member gained gets added to it (for undo)
+def apply_interaction(interaction_type, post_url, matched_usernames, total_tag_occurrences, extracted_date, deltas=None):
+    # If this is a tags interaction type, we award based on occurrence count
+    if interaction_type == 'tags' and total_tag_occurrences > 0:
+        if not matched_usernames:
+            logger.warning("found %d tag occurrences but no matched usernames", total_tag_occurrences)
+
+    # use extracted date or current date (a screenshot only has a date, so those get noon -
+    # the real upload time is kept separately for the heatmap)
+    uploaded_at = datetime.now().isoformat()
+    timestamp = extracted_date + 'T12:00:00' if extracted_date else uploaded_at
+
+    # log this interaction for records
+    interaction = {
+        'id': uuid.uuid4().hex[:12],
+        'timestamp': timestamp,
+        'uploadedAt': uploaded_at,
+        'postUrl': post_url,
+        'type': interaction_type,
+        'usernames': matched_usernames
+    }
+    interactions.append(interaction)
+    track_interaction(interaction)
+
+    # update everyone's points based on what type of interaction this was
+    comment_counts = Counter(matched_usernames)
+    for username in matched_usernames:
+        member = roster_index.get(username)
+        if member is None:
+            continue
+        before = (member['likes'], member['comments'], member['tags'], member['total_points'])
+        if interaction_type == 'likes':
+            member['likes'] += 1
+            member['total_points'] += POINTS['likers']
+            logger.debug("added 1 like to %s", username)
+        elif interaction_type == 'comments':
+            # count how many times they commented (max 4 points per post)
+            count = comment_counts[username]
+            points_to_add = min(count, MAX_POINTS_PER_COMMENT) * POINTS['commenters']
+            member['comments'] += count
+            member['total_points'] += points_to_add
+            logger.debug("added %d comments (%d pts) to %s", count, points_to_add, username)
+        elif interaction_type == 'tags':
+            # For tags, give 5 points per occurrence detected
+            if total_tag_occurrences > 0:
+                member['tags'] += total_tag_occurrences
+                member['total_points'] += total_tag_occurrences * POINTS['tagged_users']
+                logger.debug("added %d tags (%d pts) to %s", total_tag_occurrences, total_tag_occurrences * POINTS['tagged_users'], username)
+            else:
+                # Fallback: if no occurrences detected but it's a tag type, give 1
+                member['tags'] += 1
+                member['total_points'] += POINTS['tagged_users']
+                logger.debug("added 1 tag (fallback) to %s", username)
+        leaderboard.update(member)
+
+        if deltas is not None:
+            delta = deltas.setdefault(username, [0, 0, 0, 0])  # likes, comments, tags, total_points
+            after = (member['likes'], member['comments'], member['tags'], member['total_points'])
+            for i in range(4):
+                delta[i] += after[i] - before[i]
+
+    return interaction
+
+# update last activity
+def record_activity(interaction_type, post_url, matched_count, extracted_date):
+    last_activity['timestamp'] = datetime.now().isoformat()
+    last_activity['post_url'] = post_url or 'No URL provided'
+    last_activity['type'] = interaction_type
+    last_activity['matched_count'] = matched_count
+    last_activity['extracted_date'] = extracted_date
+
+# save undo state - with sqlite in the database, so undo works from whichever worker gets the click
+def push_undo(entry):
+    if db is not None:
+        db.push_undo(entry, UNDO_HISTORY_LIMIT)
+        return
+    undo_stack.append(entry)
+    logger.debug("undo state saved stack_size=%d", len(undo_stack))
+
+    # entries are just deltas now so we can afford a much longer history
+    if len(undo_stack) > UNDO_HISTORY_LIMIT:
+        undo_stack.pop(0)
+
+# bumps the per-screenshot counters for /api/metrics
+def count_screenshot(interaction_type, matched_usernames, total_tag_occurrences):
+    SCREENSHOTS_PROCESSED.inc(type=interaction_type)
+    USERNAME_MATCHES.inc(len(matched_usernames), type=interaction_type)
+    if interaction_type == 'tags':
+        TAG_OCCURRENCES.inc(total_tag_occurrences)
+
+def wants_duplicates(form):
+    return form.get('allow_duplicate', '').lower() in ('1', 'true', 'on', 'yes')
+
+def checks_duplicates(post_url, interaction_type):
+    return DUPLICATE_CHECK and (interaction_type != 'tags' or bool(post_url))
+
+# what has to be the same for a near-copy to count as a duplicate - None when nobody
+# matched (nothing would get counted twice anyway)
+def screenshot_signature(matched_usernames, info):
+    if not matched_usernames:
+        return None
+    return (tuple(sorted(matched_usernames)), info['extracted_date'], info['total_tag_occurrences'])
+
+# earlier upload this screenshot is a copy of, or None - before OCR (no signature) going by the
+# image alone, after OCR a near-copy only if it matched the same members too
+# matched_usernames = what the earlier upload counted, for the uploader to check against
+def find_duplicate(post_url, interaction_type, image_hash, image_digest, signature=None):
+    if not checks_duplicates(post_url, interaction_type):
+        return None
+    found = screenshot_hashes.find(post_url, interaction_type, image_hash, image_digest, signature)
+    if found is None:
+        return None
+    entry, distance = found
+    return {'uploaded_at': entry['uploaded_at'], 'interaction_id': entry['interaction_id'], 'distance': distance,
+            'matched_usernames': list(entry['signature'][0]) if entry['signature'] else []}
+
+def remember_screenshot(post_url, interaction_type, image_hash, image_digest, signature, interaction_id):
+    if checks_duplicates(post_url, interaction_type):
+        screenshot_hashes.add(post_url, interaction_type, image_hash, image_digest, signature,
+                              interaction_id, datetime.now().isoformat())
+
+def duplicate_response(interaction_type, duplicate):
+    DUPLICATES_REJECTED.inc(type=interaction_type)
+    return jsonify({
+        'success': False,
+        'duplicate': True,
+        'duplicate_of': duplicate,
+        'error': f"Looks like the same screenshot that was uploaded at {duplicate['uploaded_at'][11:16]} "
+                 f"(it matched {len(duplicate['matched_usernames'])} members) - if it's a different one, send it with allow_duplicate"
+    }), 409
+
 # the main feature!! processes screenshots to extract usernames
+# stays synchronous on purpose: OCR runs inside this request and the result comes back in
+# the response, for scripts that want it right away. the upload page goes through /api/jobs,
+# which is what keeps slow OCR off the request threads (same for /api/process-screenshots)
 @app.route('/api/process-screenshot', methods=['POST'])
 @login_required
 def process_screenshot():
@@ -300,207 +1490,59 @@ def process_screenshot():
         interaction_type = request.form['type']
         post_url = request.form.get('post_url', '')
         manual_username = request.form.get('manual_username', '').lower().strip().replace('@', '')
+        allow_duplicate = wants_duplicates(request.form)
+        image_bytes = image_file.read()
 
-        # initialize variables at the start
-        total_tag_occurrences = 0
-        extracted_date = None
-
-        # save current state for undo
-        roster_backup = json.loads(json.dumps(roster))  # deep copy
+        # already uploaded today (same file, or a re-saved copy)? don't spend OCR on it
+        with STAGE_SECONDS.time(stage='hash'):
+            image_hash = dedupe.dhash(image_bytes)
+            image_digest = dedupe.digest(image_bytes)
+        duplicate = None if allow_duplicate else find_duplicate(post_url, interaction_type, image_hash, image_digest)
+        if duplicate:
+            return duplicate_response(interaction_type, duplicate)
 
         # run OCR on the screenshot
-        image = Image.open(image_file)
-        text = pytesseract.image_to_string(image)
-        
-        print(f"\n\\\ ===== PROCESSING NEW SCREENSHOT =====")
-        print(f"Interaction type: {interaction_type}")
-        print(f"Full OCR text:\n{text}\n")
-
-        # try to extract date from screenshot text (Instagram format: "Dec 17" or "December 17")
-        date_patterns = [
-            r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2}',
-            r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}'
-        ]
-        for pattern in date_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    if date_parser:
-                        extracted_date = date_parser.parse(match.group() + f" {datetime.now().year}").date().isoformat()
-                except:
-                    pass
-                break
+        text = ocr_image_bytes(image_bytes, interaction_type)
 
-        # count story mentions and post tags (these are worth 5 points each)
-        story_mention_count = len(re.findall(r'mentioned\s+you\s+in\s+(their|a)\s+story', text, re.IGNORECASE))
-        post_tag_count = len(re.findall(r'tagged\s+you\s+in\s+(a|their)\s+post', text, re.IGNORECASE))
-        
-        # define total BEFORE using it
-        total_tag_occurrences = story_mention_count + post_tag_count
-        
-        print(f"Story mentions detected: {story_mention_count}")
-        print(f"Post tags detected: {post_tag_count}")
-        print(f"Total tag occurrences: {total_tag_occurrences}")
-        
-        # extract username from the TOP of the DM/notification
-        # instagram puts the username in the first few lines, usually alone on a line
-        potential_usernames = []
-        
-        # if manual username provided, use that instead of OCR
-        if manual_username and interaction_type == 'tags':
-            print(f"Using manual username: {manual_username}")
-            potential_usernames = [manual_username]
-        elif interaction_type == 'tags' and total_tag_occurrences > 0:
-            # for tags, focus on the first 10 lines to find the username at the top
-            # Instagram shows: Display Name, then @handle below it
-            first_lines = text.split('\n')[:10]
-            print(f"First 10 lines of screenshot:")
-            for idx, line in enumerate(first_lines):
-                print(f"  Line {idx}: '{line}'")
-
-            # look specifically for the @handle (is after @)
-            for line in first_lines:
-                line = line.strip()
-                if not line or len(line) < 2:
-                    continue
-                
-                # skip common UI text
-                if any(skip in line.lower() for skip in ['mentioned', 'tagged', 'story', 'post', 'notification', 'at ', 'pm', 'am', 'sep', 'oct', 'nov', 'dec']):
-                    continue
+        logger.debug("ocr text type=%s\n%s", interaction_type, text)
 
-                # look for handles that start with _ or contain @
-                if line.startswith('_') or '@' in line:
-                    clean_word = line.strip('@.,!?(){}[]"\'').strip()
-                    if clean_word and 2 <= len(clean_word) <= 30:
-                        potential_usernames.append(clean_word)
-                        print(f"Found Instagram handle: '{clean_word}'")
-                        break
-                
-                if potential_usernames:
-                    break
-            
-            # if still no username found, try any alphanumeric word that looks like a handle
-            if not potential_usernames:
-                print("No handle with _ found, trying fallback method...")
-                for line in first_lines[:5]:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    if any(skip in line.lower() for skip in ['mentioned', 'tagged', 'story', 'post', 'sep', 'oct', 'nov', 'dec', 'at ', 'pm', 'am']):
-                        continue
-                    
-                    words = line.split()
-                    for word in words:
-                        clean_word = word.strip('@.,!?(){}[]"\'')
-                        if clean_word and 2 <= len(clean_word) <= 30:
-                            alphanumeric_count = sum(c.isalnum() or c in '._' for c in clean_word)
-                            if alphanumeric_count >= len(clean_word) * 0.8:
-                                potential_usernames.append(clean_word)
-                                print(f"Found potential username: '{clean_word}'")
-                                break
-                    
-                    if potential_usernames:
-                        break
-        else:
-            # for likes/comments, extract usernames normally from the whole text
-            print("Non-tag interaction, extracting usernames from full text")
-            lines = text.split('\n')
-            for line in lines: 
-                line = line.strip()
-                if '@' in line or any(c.isalnum() for c in line):
-                    words = line.split()
-                    for word in words:
-                        clean_word = word.strip("@.,!?(){}[]")
-                        if clean_word and len(clean_word) > 2:
-                            potential_usernames.append(clean_word)
-        
-        print(f"All potential usernames extracted: {potential_usernames}")
-        
-        # match against our actual roster using fuzzy matching
-        roster_usernames = [m['username'] for m in roster]
-        matched_usernames = []
-        
-        for potential in potential_usernames:
-            matches = fuzzy_match(potential, roster_usernames)
-            matched_usernames.extend(matches)
+        with STAGE_SECONDS.time(stage='extract'):
+            info = extract_screenshot_info(text, interaction_type, manual_username)
+        extracted_date = info['extracted_date']
+        total_tag_occurrences = info['total_tag_occurrences']
+        potential_usernames = info['potential_usernames']
 
-        # remove duplicates but keep order
-        matched_usernames = list(dict.fromkeys(matched_usernames))
-        
-        print(f"Final matched usernames: {matched_usernames}")
-        
-        # If this is a tags interaction type, we award based on occurrence count
-        if interaction_type == 'tags' and total_tag_occurrences > 0:
-            print(f"Tags mode: Found {total_tag_occurrences} tag occurrences")
-            if matched_usernames:
-                points_per_person = total_tag_occurrences
-                print(f"Will award {points_per_person} tag occurrences (×5 pts each) to each matched user")
-            else:
-                print(f"WARNING: Found {total_tag_occurrences} tags but no matched usernames!")
-        
-        # use extracted date or current date
-        timestamp = extracted_date + 'T12:00:00' if extracted_date else datetime.now().isoformat()
+        # don't step on a queued job that's updating the roster right now
+        with state_write():
+            with STAGE_SECONDS.time(stage='match'):
+                matched_usernames = match_usernames(potential_usernames)
+
+            # a near-copy of an earlier upload (or the same file, applied by another request
+            # while we were OCRing) that matched the same members
+            signature = screenshot_signature(matched_usernames, info)
+            duplicate = None if allow_duplicate else find_duplicate(post_url, interaction_type, image_hash, image_digest, signature)
+            if duplicate:
+                return duplicate_response(interaction_type, duplicate)
+
+            # remember what each member gained so undo can take exactly that back
+            member_deltas = {}
+
+            count_screenshot(interaction_type, matched_usernames, total_tag_occurrences)
+            interaction = apply_interaction(interaction_type, post_url, matched_usernames, total_tag_occurrences, extracted_date, member_deltas)
+            with STAGE_SECONDS.time(stage='persist'):
+                log_added_interactions([interaction])
+                schedule_save('roster', roster_members(member_deltas))
+
+            record_activity(interaction_type, post_url, len(matched_usernames), extracted_date)
+            schedule_save('activity')
+
+            push_undo({
+                'action': 'process_screenshot',
+                'member_deltas': member_deltas,
+                'interaction_ids': [interaction['id']]
+            })
+            remember_screenshot(post_url, interaction_type, image_hash, image_digest, signature, interaction['id'])
 
-        # log this interaction for records
-        interaction = {
-            'timestamp': timestamp,
-            'postUrl': post_url,
-            'type': interaction_type,
-            'usernames': matched_usernames
-        }
-        interactions.append(interaction)
-        save_interactions()
-
-        # update everyone's points based on what type of interaction this was
-        for username in matched_usernames:
-            for member in roster:
-                if member['username'] == username:
-                    if interaction_type == 'likes':
-                        member['likes'] += 1
-                        member['total_points'] += POINTS['likers']
-                        print(f"Added 1 like to {username}")
-                    elif interaction_type == 'comments':
-                        # count how many times they commented (max 4 points per post)
-                        count = matched_usernames.count(username)
-                        points_to_add = min(count, MAX_POINTS_PER_COMMENT) * POINTS['commenters']
-                        member['comments'] += count
-                        member['total_points'] += points_to_add
-                        print(f"Added {count} comments ({points_to_add} pts) to {username}")
-                    elif interaction_type == 'tags':
-                        # For tags, give 5 points per occurrence detected
-                        if total_tag_occurrences > 0:
-                            member['tags'] += total_tag_occurrences
-                            member['total_points'] += total_tag_occurrences * POINTS['tagged_users']
-                            print(f"Added {total_tag_occurrences} tags ({total_tag_occurrences * 5} pts) to {username}")
-                        else:
-                            # Fallback: if no occurrences detected but it's a tag type, give 1
-                            member['tags'] += 1
-                            member['total_points'] += POINTS['tagged_users']
-                            print(f"Added 1 tag (5 pts) to {username} (fallback)")
-                    break
-
-        save_roster()
-        
-        # update last activity
-        last_activity['timestamp'] = datetime.now().isoformat()
-        last_activity['post_url'] = post_url or 'No URL provided'
-        last_activity['type'] = interaction_type
-        last_activity['matched_count'] = len(matched_usernames)
-        last_activity['extracted_date'] = extracted_date
-        save_activity()
-        
-        # save undo state
-        undo_stack.append({
-            'action': 'process_screenshot',
-            'roster_before': roster_backup,
-            'interaction': interaction
-        })
-        print(f"[DEBUG] Undo state saved. Total undo stack size: {len(undo_stack)}")
-        
-        # keep only last 20 actions for better undo history
-        if len(undo_stack) > 20:
-            undo_stack.pop(0)
-            
         return jsonify({
             'success': True,
             'matched_count': len(matched_usernames),
@@ -510,13 +1552,276 @@ def process_screenshot():
             'ocr_text_preview': text[:300],  # first 300 chars for debugging
             'tag_occurrences': total_tag_occurrences if interaction_type == 'tags' else 0
         })
-        
+
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        logger.error("screenshot processing failed\n%s", error_trace)
+        ERRORS.inc(where='process_screenshot')
+        return jsonify({'success': False, 'error': str(e), 'traceback': error_trace}), 500
+
+# OCRs a list of screenshots in parallel, then applies + saves everything once
+# shared by the batch endpoint and the background job workers
+def run_screenshot_batch(image_bytes_list, interaction_type, post_url, manual_username, allow_duplicate=False):
+    logger.debug("processing batch images=%d type=%s", len(image_bytes_list), interaction_type)
+    pool = get_ocr_pool()
+
+    # hash everything first and don't OCR files that were already uploaded today, near-copies
+    # included (or that are in this same batch twice) - see dedupe.py
+    with STAGE_SECONDS.time(stage='hash'):
+        hashes = list(pool.map(dedupe.dhash, image_bytes_list))
+        digests = [dedupe.digest(image_bytes) for image_bytes in image_bytes_list]
+    duplicates = [None] * len(image_bytes_list)
+    if not allow_duplicate and checks_duplicates(post_url, interaction_type):
+        first_seen = {}  # digest -> first position in this batch
+        for idx, image_digest in enumerate(digests):
+            duplicates[idx] = find_duplicate(post_url, interaction_type, hashes[idx], image_digest)
+            if duplicates[idx] is None and image_digest in first_seen:
+                duplicates[idx] = {'batch_index': first_seen[image_digest], 'distance': 0}
+            first_seen.setdefault(image_digest, idx)
+    to_ocr = [idx for idx in range(len(image_bytes_list)) if duplicates[idx] is None]
+
+    texts = {}
+    profile = ocr_profile(interaction_type)
+    ocr_results = pool.map(ocr_worker.run_ocr, [image_bytes_list[idx] for idx in to_ocr],
+                           [profile] * len(to_ocr), [OCR_CACHE_DIR] * len(to_ocr))
+    for idx, (text, timings) in zip(to_ocr, ocr_results):
+        record_ocr_timings(timings)
+        texts[idx] = text
+
+    # only one batch/job touches the roster at a time
+    with state_write():
+        # what each member gained (one undo entry covers the whole batch)
+        member_deltas = {}
+
+        results = []
+        batch_interactions = []
+        all_matched = []
+        last_extracted_date = None
+        for idx in range(len(image_bytes_list)):
+            if duplicates[idx] is None:
+                text = texts[idx]
+                with STAGE_SECONDS.time(stage='extract'):
+                    info = extract_screenshot_info(text, interaction_type, manual_username)
+                with STAGE_SECONDS.time(stage='match'):
+                    matched_usernames = match_usernames(info['potential_usernames'])
+                # a near-copy of an earlier upload or of an earlier screenshot in this batch (those
+                # are in the index by now), or the same file applied while we were OCRing
+                signature = screenshot_signature(matched_usernames, info)
+                if not allow_duplicate:
+                    duplicates[idx] = find_duplicate(post_url, interaction_type, hashes[idx], digests[idx], signature)
+            if duplicates[idx] is not None:
+                DUPLICATES_REJECTED.inc(type=interaction_type)
+                results.append({'duplicate': True, 'duplicate_of': duplicates[idx], 'matched_count': 0, 'matched_usernames': []})
+                continue
+
+            count_screenshot(interaction_type, matched_usernames, info['total_tag_occurrences'])
+            interaction = apply_interaction(interaction_type, post_url, matched_usernames,
+                                            info['total_tag_occurrences'], info['extracted_date'], member_deltas)
+            batch_interactions.append(interaction)
+            all_matched.extend(matched_usernames)
+            if info['extracted_date']:
+                last_extracted_date = info['extracted_date']
+            results.append({
+                'matched_count': len(matched_usernames),
+                'matched_usernames': matched_usernames,
+                'extracted_date': info['extracted_date'],
+                'ocr_text_preview': text[:300],
+                'tag_occurrences': info['total_tag_occurrences'] if interaction_type == 'tags' else 0
+            })
+
+            remember_screenshot(post_url, interaction_type, hashes[idx], digests[idx], signature, interaction['id'])
+
+        # nothing new in the whole batch - nothing to save or undo
+        if batch_interactions:
+            # one write per file for the whole batch
+            with STAGE_SECONDS.time(stage='persist'):
+                log_added_interactions(batch_interactions)
+                schedule_save('roster', roster_members(member_deltas))
+
+            record_activity(interaction_type, post_url, len(all_matched), last_extracted_date)
+            schedule_save('activity')
+
+            push_undo({
+                'action': 'process_batch',
+                'member_deltas': member_deltas,
+                'interaction_ids': [interaction['id'] for interaction in batch_interactions]
+            })
+
+    return {
+        'success': True,
+        'processed_count': len(batch_interactions),
+        'duplicate_count': len(results) - len(batch_interactions),
+        'matched_count': len(all_matched),
+        'matched_usernames': list(dict.fromkeys(all_matched)),
+        'results': results
+    }
+
+# batch version - OCR runs in parallel across all cores, then everything gets applied + saved once
+# (synchronous like /api/process-screenshot - /api/jobs is the queued version of this)
+@app.route('/api/process-screenshots', methods=['POST'])
+@login_required
+def process_screenshots_batch():
+    try:
+        image_files = request.files.getlist('images')
+        interaction_type = request.form['type']
+        post_url = request.form.get('post_url', '')
+        manual_username = request.form.get('manual_username', '').lower().strip().replace('@', '')
+
+        if not image_files:
+            return jsonify({'success': False, 'error': 'No screenshots uploaded'}), 400
+        if len(image_files) > MAX_BATCH_SIZE:
+            return jsonify({'success': False, 'error': f'Maximum {MAX_BATCH_SIZE} screenshots per batch'}), 400
+
+        image_bytes_list = [image_file.read() for image_file in image_files]
+        return jsonify(run_screenshot_batch(image_bytes_list, interaction_type, post_url, manual_username,
+                                            wants_duplicates(request.form)))
+
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"[DEBUG] Screenshot processing error:\n{error_trace}")
+        logger.error("batch processing failed\n%s", error_trace)
+        ERRORS.inc(where='process_screenshots')
         return jsonify({'success': False, 'error': str(e), 'traceback': error_trace}), 500
 
+# background workers for queued screenshot jobs - created on first use
+def get_job_executor():
+    global job_executor
+    if job_executor is None:
+        job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS)
+    return job_executor
+
+# what the client sees for a job (no internal event objects) - call with jobs_lock held
+def job_public_view(job):
+    return {k: v for k, v in job.items() if k != 'done_event'}
+
+# with sqlite, copies a job's client view into the database so status polls that land on
+# another worker can answer too - called after the change, outside jobs_lock
+def publish_job(view):
+    if db is not None:
+        db.save_job(view, MAX_JOBS_KEPT)
+
+# a job as the client sees it, from whichever worker ran it - None if there's no such job
+def find_job_view(job_id):
+    if db is not None:
+        return db.load_job(job_id)
+    with jobs_lock:
+        job = jobs.get(job_id)
+        return job_public_view(job) if job else None
+
+# forget the oldest finished jobs so the job table doesn't grow forever (jobs_lock held)
+def prune_jobs():
+    finished = [job_id for job_id, job in jobs.items() if job['status'] in ('done', 'failed')]
+    while len(jobs) > MAX_JOBS_KEPT and finished:
+        jobs.pop(finished.pop(0), None)
+
+# runs in a background thread - does the actual OCR + points update for a job
+# every change to the job happens under jobs_lock, so a status request never sees it half-updated
+def run_job(job_id, image_bytes_list, interaction_type, post_url, manual_username, allow_duplicate=False):
+    with jobs_lock:
+        job = jobs[job_id]
+        job['status'] = 'running'
+        job['started_at'] = datetime.now().isoformat()
+        view = job_public_view(job)
+    publish_job(view)
+    try:
+        result = run_screenshot_batch(image_bytes_list, interaction_type, post_url, manual_username, allow_duplicate)
+        outcome = {'result': result, 'status': 'done'}
+    except Exception as e:
+        logger.exception("job failed job_id=%s", job_id)
+        ERRORS.inc(where='job')
+        outcome = {'error': str(e), 'status': 'failed'}
+    with jobs_lock:
+        job.update(outcome, finished_at=datetime.now().isoformat())
+        view = job_public_view(job)
+    try:
+        publish_job(view)
+    finally:
+        job['done_event'].set()
+
+# queue screenshots for processing and return right away with a job id
+@app.route('/api/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    image_files = request.files.getlist('images') or request.files.getlist('image')
+    interaction_type = request.form.get('type')
+    post_url = request.form.get('post_url', '')
+    manual_username = request.form.get('manual_username', '').lower().strip().replace('@', '')
+
+    if not image_files:
+        return jsonify({'success': False, 'error': 'No screenshots uploaded'}), 400
+    if not interaction_type:
+        return jsonify({'success': False, 'error': 'Interaction type is required'}), 400
+    if len(image_files) > MAX_BATCH_SIZE:
+        return jsonify({'success': False, 'error': f'Maximum {MAX_BATCH_SIZE} screenshots per batch'}), 400
+
+    # read the uploads now - the request is gone by the time a worker picks this up
+    image_bytes_list = [image_file.read() for image_file in image_files]
+
+    job_id = uuid.uuid4().hex
+    with jobs_lock:
+        jobs[job_id] = {
+            'id': job_id,
+            'status': 'queued',
+            'type': interaction_type,
+            'image_count': len(image_bytes_list),
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+            'done_event': threading.Event()
+        }
+        prune_jobs()
+        view = job_public_view(jobs[job_id])
+    publish_job(view)
+
+    get_job_executor().submit(run_job, job_id, image_bytes_list, interaction_type, post_url, manual_username,
+                              wants_duplicates(request.form))
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'}), 202
+
+# poll a job's status
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    view = find_job_view(job_id)
+    if not view:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(view)
+
+# or subscribe - server-sent events, one message per status change until the job finishes
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def stream_job(job_id):
+    first_view = find_job_view(job_id)
+    if not first_view:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    with jobs_lock:
+        job = jobs.get(job_id)
+    # a job running on another worker has no event here to wait on - just check every second
+    done_event = job['done_event'] if job else threading.Event()
+
+    def generate():
+        view = first_view
+        last_status = None
+        while True:
+            if view['status'] != last_status:
+                last_status = view['status']
+                yield f"data: {json.dumps(view)}\n\n"
+            if view['status'] in ('done', 'failed'):
+                break
+            # wake up when the job finishes, or every so often to report queued -> running
+            done_event.wait(1)
+            if job is not None:
+                with jobs_lock:
+                    view = job_public_view(job)
+            else:
+                view = find_job_view(job_id)
+                if view is None:
+                    break  # pruned from the database already
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
 # generate the leaderboard sorted by points
 @app.route('/api/leaderboard', methods=['GET'])
 @login_required
@@ -524,100 +1829,125 @@ def get_leaderboard():
     # get date filters if provided
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    
-    # if dates provided, recalculate points from interactions
+    # ?top=10 for just the first few (without dates it's read straight off the ranking)
+    try:
+        top = min(max(int(request.args['top']), 1), MAX_PAGE_SIZE) if 'top' in request.args else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid top'}), 400
+    return cached_json_response(lambda: build_leaderboard(start_date, end_date, top))
+
+# one member's rank plus the people just above and below them - "you're 14th, 3 pts behind ..."
+@app.route('/api/leaderboard/rank/<username>', methods=['GET'])
+@login_required
+def get_member_rank(username):
+    username = username.lower().strip().replace('@', '')
+    try:
+        around = min(max(int(request.args.get('around', 2)), 0), MAX_PAGE_SIZE // 2)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid around'}), 400
+
+    def build():
+        member = roster_index[username]
+        first_rank, nearby = leaderboard.around(member, around)
+        return {
+            'username': username,
+            'rank': leaderboard.rank(member),
+            'total_points': member['total_points'],
+            'members': len(leaderboard),
+            'neighbours': [
+                {'rank': rank, 'username': m['username'], 'first_name': m['first_name'],
+                 'last_name': m['last_name'], 'total_points': m['total_points']}
+                for rank, m in enumerate(nearby, first_rank)
+            ]
+        }
+
+    with state_lock.read():
+        if username not in roster_index:
+            return jsonify({'success': False, 'error': f"'{username}' is not on the roster"}), 404
+        return cached_json_response(build)
+
+def build_leaderboard(start_date=None, end_date=None, top=None):
+    # if dates provided, pull points for that range out of the daily table
+    # (works on copies so the real running totals stay untouched)
     if start_date or end_date:
-        # reset points
+        if db is not None:
+            ranged = db.points_in_range(start_date, end_date, POINTS, MAX_POINTS_PER_COMMENT)
+        else:
+            ranged = points_in_range(start_date, end_date)
+        ranged_roster = []
         for member in roster:
-            member['likes'] = 0
-            member['comments'] = 0
-            member['tags'] = 0
-            member['total_points'] = 0
-        
-        # filter interactions by date
-        filtered_interactions = interactions
-        if start_date or end_date:
-            filtered_interactions = []
-            for interaction in interactions:
-                interaction_date = interaction['timestamp'][:10]  # YYYY-MM-DD
-                
-                include = True
-                if start_date and interaction_date < start_date:
-                    include = False
-                if end_date and interaction_date > end_date:
-                    include = False
-                    
-                if include:
-                    filtered_interactions.append(interaction)
-        
-        # recalculate points from filtered interactions
-        for interaction in filtered_interactions:
-            interaction_type = interaction['type']
-            matched_usernames = interaction['usernames']
-            
-            for username in matched_usernames:
-                for member in roster:
-                    if member['username'] == username:
-                        if interaction_type == 'likes':
-                            member['likes'] += 1
-                            member['total_points'] += POINTS['likers']
-                        elif interaction_type == 'comments':
-                            count = matched_usernames.count(username)
-                            points_to_add = min(count, MAX_POINTS_PER_COMMENT) * POINTS['commenters']
-                            member['comments'] += count
-                            member['total_points'] += points_to_add
-                        elif interaction_type == 'tags':
-                            member['tags'] += 1
-                            member['total_points'] += POINTS['tagged_users']
-                        break
-    
-    # use the total_points we've been tracking
-    for member in roster:
-        member['total'] = member['total_points']
+            likes, comments, tags, total_points = ranged.get(member['username'], (0, 0, 0, 0))
+            ranged_roster.append({
+                **member,
+                'likes': likes,
+                'comments': comments,
+                'tags': tags,
+                'total_points': total_points,
+                'total': total_points
+            })
+        sorted_roster = sorted(ranged_roster, key=lambda x: x['total'], reverse=True)
+        return sorted_roster[:top] if top else sorted_roster
     
-    # sort highest to lowest
-    sorted_roster = sorted(roster, key=lambda x: x['total'], reverse=True)
-    return jsonify(sorted_roster)
+    # use the total_points we've been tracking, already in order (on copies - a GET never touches the roster)
+    return [{**member, 'total': member['total_points']} for member in leaderboard.top(top)]
 
 @app.route('/api/undo', methods=['POST'])
 @login_required
 def undo_action():
     """Undo the last screenshot processing action"""
-    global roster, interactions
-    
-    print(f"[DEBUG] Undo requested. Stack size: {len(undo_stack)}")
-    
-    if not undo_stack:
-        print("[DEBUG] Undo stack is empty!")
-        return jsonify({'success': False, 'error': 'Nothing to undo - upload history is empty'}), 400
-    
     try:
-        last_action = undo_stack.pop()
-        print(f"[DEBUG] Undoing action: {last_action['action']}")
+        with state_write():
+            # checked under the lock so two undo clicks can't both grab the last entry
+            # (with sqlite the pop is part of this write transaction)
+            if db is not None:
+                last_action = db.pop_undo()
+            else:
+                last_action = undo_stack.pop() if undo_stack else None
+            if last_action is None:
+                logger.debug("undo stack is empty")
+                return jsonify({'success': False, 'error': 'Nothing to undo - upload history is empty'}), 400
+
+            logger.debug("undoing action=%s", last_action['action'])
         
-        if last_action['action'] == 'process_screenshot':
-            # restore roster state
-            print(f"[DEBUG] Restoring roster from backup (size: {len(last_action['roster_before'])})")
-            roster.clear()
-            roster.extend(last_action['roster_before'])
+            if last_action['action'] in ('process_screenshot', 'process_batch'):
+                # take back exactly what each member gained (members deleted since then are skipped)
+                logger.debug("reverting points members=%d", len(last_action['member_deltas']))
+                for username, delta in last_action['member_deltas'].items():
+                    member = roster_index.get(username)
+                    if member is None:
+                        continue
+                    member['likes'] -= delta[0]
+                    member['comments'] -= delta[1]
+                    member['tags'] -= delta[2]
+                    member['total_points'] -= delta[3]
+                    leaderboard.update(member)
             
-            # remove the interaction from log
-            interaction_to_remove = last_action['interaction']
-            original_size = len(interactions)
-            interactions[:] = [i for i in interactions if i != interaction_to_remove]
-            print(f"[DEBUG] Removed interaction. Interactions: {original_size} -> {len(interactions)}")
+                # remove the interactions from log - they're near the end, so search backwards
+                original_size = len(interactions)
+                removed = []
+                for interaction_id in last_action['interaction_ids']:
+                    for idx in range(len(interactions) - 1, -1, -1):
+                        if interactions[idx].get('id') == interaction_id:
+                            removed.append(interactions.pop(idx))
+                            break
+                for interaction in removed:
+                    track_interaction(interaction, sign=-1)
+                screenshot_hashes.forget(last_action['interaction_ids'])
+                log_interaction_events([{'op': 'remove', 'interactions': removed}])
+                logger.debug("removed interactions %d -> %d", original_size, len(interactions))
             
-            save_roster()
-            save_interactions()
+                schedule_save('roster', roster_members(last_action['member_deltas']))
             
-            print(f"[DEBUG] Undo successful. Remaining undos: {len(undo_stack)}")
-            return jsonify({'success': True, 'message': 'Last action undone', 'remaining_undos': len(undo_stack)})
+                remaining = db.undo_status()[0] if db is not None else len(undo_stack)
+                logger.info("undo done remaining_undos=%d", remaining)
+                return jsonify({'success': True, 'message': 'Last action undone', 'remaining_undos': remaining})
         
         return jsonify({'success': False, 'error': 'Unknown action type'}), 400
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"[DEBUG] Undo error: {error_trace}")
+        logger.error("undo failed\n%s", error_trace)
+        ERRORS.inc(where='undo')
         return jsonify({'success': False, 'error': f'Undo failed: {str(e)}'}), 500
 
 @app.route('/api/export', methods=['GET'])
@@ -625,9 +1955,8 @@ def undo_action():
 def export_leaderboard():
     """Export leaderboard as CSV"""
     # get current leaderboard
-    for member in roster:
-        member['total'] = member['total_points']
-    sorted_roster = sorted(roster, key=lambda x: x['total'], reverse=True)
+    with state_lock.read():
+        sorted_roster = build_leaderboard()
     
     # create CSV
     output = io.StringIO()
@@ -660,36 +1989,176 @@ def export_leaderboard():
 @login_required
 def get_last_activity():
     """Get info about last upload"""
-    return jsonify(last_activity if last_activity else {'timestamp': None})
+    return cached_json_response(lambda: last_activity if last_activity else {'timestamp': None})
+
+# cursors are opaque to clients - position of the next (older) interaction to return,
+# plus its id when it has one so we can find it again if the list shifted
+def encode_cursor(position):
+    payload = {'pos': position}
+    if 0 <= position < len(interactions) and interactions[position].get('id'):
+        payload['id'] = interactions[position]['id']
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_cursor(cursor):
+    payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    position = min(int(payload['pos']), len(interactions) - 1)
+    expected_id = payload.get('id')
+    if expected_id and (position < 0 or interactions[position].get('id') != expected_id):
+        # something before it got undone - look for it a bit further back
+        for idx in range(min(position, len(interactions) - 1), -1, -1):
+            if interactions[idx].get('id') == expected_id:
+                return idx
+    return position
+
+def interaction_matches(interaction, filters):
+    if filters['type'] and interaction['type'] != filters['type']:
+        return False
+    if filters['username'] and filters['username'] not in interaction['usernames']:
+        return False
+    if filters['post_url'] and interaction.get('postUrl', interaction.get('post_url', '')) != filters['post_url']:
+        return False
+    day = interaction['timestamp'][:10]
+    if filters['start_date'] and day < filters['start_date']:
+        return False
+    if filters['end_date'] and day > filters['end_date']:
+        return False
+    return True
 
 @app.route('/api/interactions', methods=['GET'])
 @login_required
 def get_interactions():
-    """Get all interactions for analytics"""
-    return jsonify(interactions)
+    """Get interactions newest first, one page at a time, with optional filters"""
+    filters = {
+        'type': request.args.get('type'),
+        'username': request.args.get('username', '').lower().strip().replace('@', ''),
+        'post_url': request.args.get('post_url'),
+        'start_date': request.args.get('start_date'),
+        'end_date': request.args.get('end_date')
+    }
+
+    with state_lock.read():
+        ensure_interactions_loaded()
+        try:
+            limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+            cursor = request.args.get('cursor')
+            position = decode_cursor(cursor) if cursor else len(interactions) - 1
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'success': False, 'error': 'Invalid limit or cursor'}), 400
+
+        page = []
+        while position >= 0 and len(page) < limit:
+            interaction = interactions[position]
+            if interaction_matches(interaction, filters):
+                page.append(interaction)
+            position -= 1
+
+        return jsonify({
+            'interactions': page,
+            'next_cursor': encode_cursor(position) if position >= 0 else None
+        })
+
+@app.route('/api/analytics', methods=['GET'])
+@login_required
+def get_analytics():
+    """Precomputed chart data for the analytics dashboard"""
+    with state_lock.read():
+        return build_analytics()
+
+def build_analytics():
+    ensure_interactions_loaded()  # for the heatmap
+    def display_name(username):
+        member = roster_index.get(username)
+        return f"{member['first_name']} {member['last_name']}" if member else username
+
+    ranked = leaderboard.top(10)
+
+    # cumulative points per day for the top 5, straight from the running daily totals
+    cumulative = get_daily_cumulative()
+    points_over_time = []
+    for member in ranked[:5]:
+        running = cumulative['totals'].get(member['username'])
+        points_over_time.append({
+            'name': display_name(member['username']),
+            'data': [totals[3] for totals in running[1:]] if running else [0] * len(cumulative['days'])
+        })
+
+    # fastest growing = most points in the last 30 days
+    thirty_days_ago = (datetime.now() - timedelta(days=30)).date().isoformat()
+    recent = points_in_range(thirty_days_ago, None)
+    growth = sorted(
+        ((username, counts[3]) for username, counts in recent.items() if counts[3] > 0),
+        key=lambda item: item[1], reverse=True
+    )[:10]
+
+    return jsonify({
+        'top_performers': [
+            {'name': display_name(m['username']), 'username': m['username'], 'total_points': m['total_points']}
+            for m in ranked[:10]
+        ],
+        'engagement': {
+            'likes': sum(m['likes'] for m in roster),
+            'comments': sum(m['comments'] for m in roster),
+            'tags': sum(m['tags'] for m in roster)
+        },
+        'points_distribution': {
+            'likes': sum(m['likes'] for m in roster) * POINTS['likers'],
+            'comments': sum(m['comments'] for m in roster) * POINTS['commenters'],
+            'tags': sum(m['tags'] for m in roster) * POINTS['tagged_users']
+        },
+        'points_over_time': {'dates': cumulative['days'], 'series': points_over_time},
+        'heatmap': {
+            'days': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+            'counts': activity_heatmap
+        },
+        'growth': [{'name': display_name(username), 'points': points} for username, points in growth]
+    })
 
 @app.route('/api/undo-status', methods=['GET'])
 @login_required
 def get_undo_status():
     """Check how many undo actions are available"""
-    return jsonify({
-        'available_undos': len(undo_stack),
-        'last_action': undo_stack[-1]['action'] if undo_stack else None
-    })
+    if db is not None:
+        count, last = db.undo_status()
+        return jsonify({'available_undos': count, 'last_action': last['action'] if last else None})
+    with state_lock.read():
+        return jsonify({
+            'available_undos': len(undo_stack),
+            'last_action': undo_stack[-1]['action'] if undo_stack else None
+        })
+
+# Prometheus scrape endpoint - no login since scrapers can't hold a session,
+# and it's only counts + timings (no usernames)
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render_all(), mimetype='text/plain; version=0.0.4')
 
 # reset everything for next semester
 @app.route('/api/reset', methods=['POST'])
 @login_required
 def reset_points():
-    for member in roster:
-        member['likes'] = 0
-        member['comments'] = 0
-        member['tags'] = 0
-        member['total_points'] = 0
-    interactions.clear()
-    save_roster()
+    with state_write():
+        for member in roster:
+            member['likes'] = 0
+            member['comments'] = 0
+            member['tags'] = 0
+            member['total_points'] = 0
+        leaderboard.rebuild(roster)
+        interactions.clear()
+        undo_stack.clear()  # nothing left to take points back from
+        if db is not None:
+            db.clear_undo()
+        screenshot_hashes.clear()
+        log_interaction_events([{'op': 'clear'}])
+        rebuild_interaction_stats()
+        schedule_save('roster')
+    # start the new semester with an empty snapshot + empty log
     save_interactions()
     return jsonify({'success': True})
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)  # Changed to port 5001 to avoid macOS AirPlay conflict
+    # with debug on, this first process only watches for code changes and restarts the one
+    # that actually serves (WERKZEUG_RUN_MAIN set) - only that one should load + save anything
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start()
+    # threaded is the default, but say it out loud - state_lock is what makes it safe
+    app.run(debug=True, port=5001, threaded=True)  # Changed to port 5001 to avoid macOS AirPlay conflict
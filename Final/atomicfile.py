@@ -0,0 +1,28 @@
+# writes a whole file atomically - into a temp file next to it, then os.replace, so a crash
+# mid-write leaves the old file behind instead of half a file
+# every write gets its own temp name (mkstemp), so two threads or processes saving the same
+# file never write into - or os.replace - each other's temp file
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(path, mode='w', **kwargs):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        # mkstemp files are owner-only - keep whatever permissions the file had before
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,370 @@
+# benchmark for the screenshot pipeline - renders fake instagram likes/comments/tags
+# screenshots with PIL, runs them through the same OCR + parsing + matching code the app
+# uses and reports images/sec, per-stage latency and how many usernames it got right
+#
+#   python benchmark.py                      # 20 screenshots of each type, 300 member roster
+#   python benchmark.py --images 50 --roster 1000 --json results.json
+#   python benchmark.py --skip-ocr           # parser + matcher only, no tesseract needed
+#   python benchmark.py --parser             # microbenchmark of just ocr_parser
+#
+#   python benchmark.py --engine pytesseract # compare against --engine tesserocr
+#   python benchmark.py --no-preprocess      # raw screenshots, vs the default preprocessing
+#   python benchmark.py --text-height 24 --format jpeg
+#   python benchmark.py --capture cropped    # likes list cropped by hand / --capture desktop
+#
+# runs completely offline, only needs a local tesseract (unless --skip-ocr)
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import ocr_engine
+import ocr_parser
+import ocr_worker
+import preprocess
+
+FIRST_NAMES = ['emma', 'liam', 'olivia', 'noah', 'ava', 'kai', 'mia', 'leo', 'zoe', 'eli', 'maya', 'owen',
+               'nora', 'jack', 'lily', 'ryan', 'ella', 'sean', 'ivy', 'luke', 'kira', 'theo', 'ana', 'milo']
+LAST_NAMES = ['kealoha', 'nakamura', 'silva', 'tanaka', 'reyes', 'kim', 'lee', 'santos', 'chang', 'mendoza',
+              'fujii', 'park', 'lopez', 'akana', 'wong', 'garcia', 'ito', 'cruz', 'smith', 'ng']
+COMMENTS = ['so cute!!', 'love this', 'see you there', 'omg yes', 'congrats!', 'need this', 'wow', 'lets go']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+STAGES = ['encode', 'decode', 'preprocess', 'ocr', 'extract', 'match']
+WIDTH, HEIGHT = 1170, 2532  # iphone 12-15 screenshot
+STATUS_BAR_HEIGHT = 140
+LINE_HEIGHT = 70
+TEXT_LEFT = 190  # right of the avatars
+
+
+# roster of made-up members with instagram-ish handles (dots, underscores, numbers)
+def generate_roster(size, rng):
+    usernames = set()
+    roster = []
+    while len(roster) < size:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        style = rng.randrange(4)
+        if style == 0:
+            username = f'{first}.{last}'
+        elif style == 1:
+            username = f'{first}_{last[:3]}{rng.randrange(100)}'
+        elif style == 2:
+            username = f'_{first}{last}'
+        else:
+            username = f'{first}{rng.choice(string.ascii_lowercase)}{rng.randrange(1000)}'
+        if username in usernames:
+            continue
+        usernames.add(username)
+        roster.append({'first_name': first.title(), 'last_name': last.title(), 'username': username,
+                       'likes': 0, 'comments': 0, 'tags': 0, 'total_points': 0})
+    return roster
+
+
+# each generator returns (lines to draw, usernames that should be matched)
+def likes_lines(roster, rng):
+    members = rng.sample(roster, min(len(roster), rng.randint(4, 10)))
+    lines = ['Likes', '']
+    for m in members:
+        lines.append(m['username'])
+        lines.append(f"{m['first_name']} {m['last_name']}    Follow")
+    return lines, {m['username'] for m in members}
+
+
+def comments_lines(roster, rng):
+    members = rng.sample(roster, min(len(roster), rng.randint(3, 6)))
+    lines = ['Comments', '']
+    # some people comment more than once, like on the real posts
+    for m in members + rng.sample(members, rng.randint(0, len(members) // 2)):
+        lines.append(f"{m['username']} {rng.choice(COMMENTS)}")
+        lines.append(f'{rng.randint(1, 6)}d    Reply')
+    return lines, {m['username'] for m in members}
+
+
+def tags_lines(roster, rng):
+    member = rng.choice(roster)
+    lines = [f"{member['first_name']} {member['last_name']}", '@' + member['username'], '']
+    for _ in range(rng.randint(1, 3)):
+        if rng.random() < 0.5:
+            lines.append('mentioned you in their story')
+        else:
+            lines.append('tagged you in a post')
+    lines.append(f'{rng.choice(MONTHS)} {rng.randint(1, 28)}')
+    return lines, {member['username']}
+
+
+GENERATORS = {'likes': likes_lines, 'comments': comments_lines, 'tags': tags_lines}
+
+
+def load_font(path, size):
+    if path:
+        return ImageFont.truetype(path, size)
+    try:
+        return ImageFont.load_default(size=size)  # scalable font on Pillow 10.1+
+    except TypeError:
+        return ImageFont.load_default()
+
+
+# phone-sized, with a status bar and an avatar next to every other line, so cropping
+# and downscaling have something realistic to work on
+def render_screenshot(lines, font):
+    image = Image.new('RGB', (WIDTH, HEIGHT), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((60, 40), '9:41', fill='black', font=font)
+    draw.rectangle((WIDTH - 160, 50, WIDTH - 70, 90), fill='black')  # battery
+    for idx, line in enumerate(lines):
+        y = STATUS_BAR_HEIGHT + LINE_HEIGHT * idx
+        if idx % 2 == 0 and line:
+            draw.ellipse((50, y, 50 + 2 * LINE_HEIGHT - 20, y + 2 * LINE_HEIGHT - 20), fill=(200, 120, 160))
+        draw.text((TEXT_LEFT, y), line, fill='black', font=font)
+    return image
+
+
+# the same screenshot the way people actually send some of them in:
+#   cropped - trimmed down to just the list, no status bar or avatars
+#   desktop - the list in the middle of a wide browser window
+def recapture(image, capture, line_count):
+    if capture == 'phone':
+        return image
+    bottom = STATUS_BAR_HEIGHT + LINE_HEIGHT * line_count + 20
+    if capture == 'cropped':
+        return image.crop((TEXT_LEFT - 20, STATUS_BAR_HEIGHT - 10, int(WIDTH * 0.8), bottom))
+    content = image.crop((0, STATUS_BAR_HEIGHT - 10, WIDTH, bottom))
+    window = Image.new('RGB', (3000, max(1800, content.size[1] + 100)), 'white')
+    window.paste(content, ((window.size[0] - WIDTH) // 2, 50))
+    return window
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+# imports the app from a scratch directory so the benchmark never loads or saves the
+# real roster/interactions files
+def import_app(workdir, tesseract_cmd, engine):
+    os.environ.setdefault('IG_STORAGE', 'files')
+    if tesseract_cmd:
+        os.environ['TESSERACT_CMD'] = tesseract_cmd
+    os.chdir(workdir)
+    # never start()ed - no data loading, background threads or shutdown save, just the pipeline functions
+    import IG_point_tracking as app_mod
+
+    if engine:
+        app_mod.OCR_ENGINE = engine
+    # every image has to actually go through tesseract
+    app_mod.OCR_CACHE_DIR = None
+    return app_mod
+
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    roster = generate_roster(args.roster, rng)
+    font = load_font(args.font, args.font_size)
+
+    workdir = tempfile.mkdtemp(prefix='ig_benchmark_')
+    cwd = os.getcwd()
+    try:
+        app_mod = import_app(workdir, args.tesseract, args.engine)
+        engine_name = ocr_engine.resolve_engine_name(app_mod.OCR_ENGINE)
+        configure_preprocess(app_mod, args)
+        app_mod.roster[:] = roster
+        app_mod.rebuild_roster_index()
+
+        timings = {stage: [] for stage in STAGES}
+        scores = {t: {'tp': 0, 'fp': 0, 'fn': 0} for t in args.types}
+        images = 0
+        pipeline_seconds = 0.0
+        pixels = {'original': 0, 'ocr': 0}
+
+        for interaction_type in args.types:
+            for _ in range(args.images):
+                lines, expected = GENERATORS[interaction_type](roster, rng)
+
+                started = time.perf_counter()
+                if args.skip_ocr:
+                    text = '\n'.join(lines)
+                else:
+                    image = recapture(render_screenshot(lines, font), args.capture, len(lines))
+                    encode_start = time.perf_counter()
+                    buffer = io.BytesIO()
+                    image.save(buffer, args.format.upper(), quality=90)  # what the browser uploads
+                    image_bytes = buffer.getvalue()
+                    timings['encode'].append(time.perf_counter() - encode_start)
+                    started = time.perf_counter()  # rendering + encoding happen on the phone, not the server
+
+                    text, ocr_timings = ocr_worker.run_ocr(image_bytes, app_mod.ocr_profile(interaction_type), app_mod.OCR_CACHE_DIR)
+                    for stage in ('decode', 'preprocess', 'ocr'):
+                        timings[stage].append(ocr_timings[stage])
+                    pixels['original'] += ocr_timings['original_pixels']
+                    pixels['ocr'] += ocr_timings['ocr_pixels']
+
+                stage_start = time.perf_counter()
+                info = app_mod.extract_screenshot_info(text, interaction_type)
+                timings['extract'].append(time.perf_counter() - stage_start)
+
+                stage_start = time.perf_counter()
+                matched = set(app_mod.match_usernames(info['potential_usernames']))
+                timings['match'].append(time.perf_counter() - stage_start)
+
+                pipeline_seconds += time.perf_counter() - started
+                images += 1
+
+                score = scores[interaction_type]
+                score['tp'] += len(matched & expected)
+                score['fp'] += len(matched - expected)
+                score['fn'] += len(expected - matched)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'images': images,
+        'roster_size': len(roster),
+        'skip_ocr': args.skip_ocr,
+        'engine': None if args.skip_ocr else engine_name,
+        'preprocess': not args.no_preprocess,
+        'capture': args.capture,
+        'pixels_saved': 1 - pixels['ocr'] / pixels['original'] if pixels['original'] else 0.0,
+        'images_per_second': images / pipeline_seconds if pipeline_seconds else 0.0,
+        'stages': {
+            stage: {
+                'mean_ms': 1000 * sum(values) / len(values),
+                'p50_ms': 1000 * percentile(values, 50),
+                'p95_ms': 1000 * percentile(values, 95),
+                'max_ms': 1000 * max(values)
+            }
+            for stage, values in timings.items() if values
+        },
+        'accuracy': {t: dict(score, **precision_recall(score)) for t, score in scores.items()},
+        'overall': precision_recall({
+            key: sum(score[key] for score in scores.values()) for key in ('tp', 'fp', 'fn')
+        })
+    }
+
+
+# applies the --no-preprocess / --no-crop / --text-height flags to every OCR profile
+def configure_preprocess(app_mod, args):
+    for profile in app_mod.OCR_PROFILES.values():
+        settings = profile.setdefault('preprocess', {})
+        if args.no_preprocess:
+            settings['enabled'] = False
+        if args.no_crop:
+            settings['crop'] = None
+        if args.text_height is not None:
+            settings['target_text_height'] = args.text_height
+        if args.resample:
+            settings['resample'] = args.resample
+
+
+# parse_screenshot_text on its own - that's all the CPU a screenshot costs when the
+# OCR text comes out of the cache. reports microseconds per screenshot text
+def run_parser_benchmark(args):
+    rng = random.Random(args.seed)
+    roster = generate_roster(args.roster, rng)
+    results = {}
+    for interaction_type in args.types:
+        texts = ['\n'.join(GENERATORS[interaction_type](roster, rng)[0]) for _ in range(args.images)]
+        best = None
+        # best of a few rounds so a GC pause or a noisy neighbour doesn't skew it
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(args.parser_rounds):
+                for text in texts:
+                    ocr_parser.parse_screenshot_text(text, interaction_type)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        calls = args.parser_rounds * len(texts)
+        results[interaction_type] = {
+            'calls': calls,
+            'us_per_text': 1e6 * best / calls,
+            'texts_per_second': calls / best
+        }
+    return results
+
+
+def print_parser_report(results):
+    print(f"{'type':<10}{'us/text':>10}{'texts/sec':>12}")
+    for interaction_type, row in results.items():
+        print(f"{interaction_type:<10}{row['us_per_text']:>10.1f}{row['texts_per_second']:>12.0f}")
+
+
+def precision_recall(score):
+    found = score['tp'] + score['fp']
+    expected = score['tp'] + score['fn']
+    return {
+        'precision': score['tp'] / found if found else 1.0,
+        'recall': score['tp'] / expected if expected else 1.0
+    }
+
+
+def print_report(results):
+    mode = 'parser + matcher only' if results['skip_ocr'] else f"full pipeline, {results['engine']}"
+    print(f"{results['images']} screenshots, {results['roster_size']} member roster ({mode})")
+    print(f"throughput: {results['images_per_second']:.2f} images/sec")
+    if not results['skip_ocr']:
+        state = 'on' if results['preprocess'] else 'off'
+        print(f"{results['capture']} captures, preprocessing {state}: {100 * results['pixels_saved']:.1f}% fewer pixels sent to OCR")
+    print()
+    print(f"{'stage':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, row in results['stages'].items():
+        print(f"{stage:<10}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['max_ms']:>10.2f}")
+    print()
+    print(f"{'type':<10}{'precision':>10}{'recall':>10}{'tp':>6}{'fp':>6}{'fn':>6}")
+    for interaction_type, row in results['accuracy'].items():
+        print(f"{interaction_type:<10}{row['precision']:>10.3f}{row['recall']:>10.3f}{row['tp']:>6}{row['fp']:>6}{row['fn']:>6}")
+    overall = results['overall']
+    print(f"{'overall':<10}{overall['precision']:>10.3f}{overall['recall']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark OCR + username matching on synthetic screenshots')
+    parser.add_argument('--images', type=int, default=20, help='screenshots per interaction type')
+    parser.add_argument('--roster', type=int, default=300, help='number of members in the generated roster')
+    parser.add_argument('--types', nargs='+', default=list(GENERATORS), choices=list(GENERATORS))
+    parser.add_argument('--seed', type=int, default=352, help='same seed = same roster + screenshots')
+    parser.add_argument('--font', help='path to a .ttf to render with (default: Pillow built-in)')
+    parser.add_argument('--font-size', type=int, default=44)
+    parser.add_argument('--format', choices=['png', 'jpeg'], default='png', help='how the screenshots get uploaded')
+    parser.add_argument('--capture', choices=['phone', 'cropped', 'desktop'], default='phone',
+                        help='full phone screenshot, cropped to the list, or a wide desktop capture')
+    parser.add_argument('--no-preprocess', action='store_true', help='send the screenshots to OCR untouched')
+    parser.add_argument('--no-crop', action='store_true', help='preprocess, but keep the whole screen')
+    parser.add_argument('--text-height', type=int, help='target text height in px for downscaling (0 = never resize)')
+    parser.add_argument('--resample', choices=list(preprocess.RESAMPLE_FILTERS), help='downscaling filter')
+    parser.add_argument('--tesseract', help='tesseract binary for the pytesseract engine (default: found on PATH)')
+    parser.add_argument('--engine', choices=['auto'] + list(ocr_engine.ENGINES), help='OCR engine (default: the app setting)')
+    parser.add_argument('--skip-ocr', action='store_true', help='feed the rendered text straight to the parser')
+    parser.add_argument('--parser', action='store_true', help='only time ocr_parser on the screenshot text')
+    parser.add_argument('--parser-rounds', type=int, default=200, help='passes over the texts per --parser timing')
+    parser.add_argument('--json', help='also write the results to this file (handy for before/after diffs)')
+    args = parser.parse_args()
+
+    if args.parser:
+        results = run_parser_benchmark(args)
+        print_parser_report(results)
+    else:
+        engine = ocr_engine.resolve_engine_name(args.engine or os.environ.get('IG_OCR_ENGINE', 'auto'))
+        if not args.skip_ocr and engine == 'pytesseract' and not (args.tesseract or ocr_engine.find_tesseract()):
+            parser.error('tesseract not found - install it, pass --tesseract, or use --skip-ocr')
+        results = run_benchmark(args)
+        print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
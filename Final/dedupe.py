@@ -0,0 +1,109 @@
+# spots screenshots that were already uploaded - same likes list re-saved from a phone,
+# sent again as a JPEG, scaled down, etc
+#   - the exact same file (sha256 of the bytes) is turned away before OCR
+#   - so is a near-copy, found by a difference hash (dHash) - but only provisionally: the
+#     hash alone can't decide, so the earlier upload's matched usernames go back with the
+#     rejection and the uploader confirms (re-sending with allow_duplicate if it's a new one).
+#     that's what skips OCR for the re-saved copies people actually send twice
+#   - after OCR, a near-copy that matched the same usernames, date and tag count is turned away
+#     too - catches two near-copies uploaded at the same time, neither in the index yet
+# why the hash can't decide alone - on the benchmark's screenshots a re-saved/rescaled copy is
+# 0-5 bits from the original, but a likes list with one row swapped can be 0-21 bits away and
+# two tag notifications that only differ in the date are 0-2 apart
+#
+# dHash: shrink to 65x64 grayscale, then 1 bit per cell for "is this brighter than its
+# right-hand neighbour". a plain 8x8 dHash can't tell two likes lists apart at all, so the
+# grid is big enough to see the text, and only cells with a real edge in them are compared -
+# flat white background flips randomly with jpeg noise and would drown out the text
+# screenshots cropped a lot differently (more than a few px) won't match, the grid moves with the crop
+import hashlib
+import io
+import threading
+from datetime import date
+
+from PIL import Image
+
+HASH_SIZE = 64  # 64x64 cells = 4096 bit hash
+EDGE_THRESHOLD = 16  # brightness step (0-255) between cells that counts as an edge
+
+
+# returns (bits, edges) - edges marks the cells whose bit actually means something
+def dhash(image_bytes):
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('L', (HASH_SIZE * 4, HASH_SIZE * 4))  # jpegs can skip most of the full decode
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = small.tobytes()
+    bits = edges = 0
+    for row in range(HASH_SIZE):
+        start = row * (HASH_SIZE + 1)
+        line = pixels[start:start + HASH_SIZE + 1]
+        for left, right in zip(line, line[1:]):
+            bits = (bits << 1) | (left > right)
+            edges = (edges << 1) | (abs(left - right) > EDGE_THRESHOLD)
+    return bits, edges
+
+
+# bits that differ where either image has an edge
+def hamming_distance(a, b):
+    return bin((a[0] ^ b[0]) & (a[1] | b[1])).count('1')
+
+
+def digest(image_bytes):
+    return hashlib.sha256(image_bytes).digest()
+
+
+# recent uploads per (post url, interaction type), only for today - a likes list from
+# yesterday is allowed to look like today's (the post just didn't get new likes)
+class ScreenshotHashIndex:
+    def __init__(self, max_distance=8, max_per_post=500):
+        self.max_distance = max_distance
+        self.max_per_post = max_per_post
+        self.day = None
+        self.entries = {}  # (post_url, interaction_type) -> [{'hash', 'digest', 'signature', 'interaction_id', 'uploaded_at'}, ...]
+        self.lock = threading.Lock()
+
+    def roll_over(self):
+        today = date.today().isoformat()
+        if self.day != today:
+            self.day = today
+            self.entries.clear()
+
+    # earlier upload this one is a copy of, as (entry, distance), or None
+    # a byte-identical upload always counts. otherwise the closest one within max_distance -
+    # before OCR (no signature) any earlier upload that matched someone, after OCR only one
+    # with the same signature
+    def find(self, post_url, interaction_type, image_hash, image_digest, signature=None):
+        with self.lock:
+            self.roll_over()
+            best = None
+            for entry in self.entries.get((post_url, interaction_type), ()):
+                if entry['digest'] == image_digest:
+                    return entry, 0
+                if entry['signature'] is None:
+                    continue  # matched nobody, so a copy of it can't count anyone twice
+                if signature is not None and entry['signature'] != signature:
+                    continue
+                distance = hamming_distance(entry['hash'], image_hash)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (entry, distance)
+            return best
+
+    def add(self, post_url, interaction_type, image_hash, image_digest, signature, interaction_id, uploaded_at):
+        with self.lock:
+            self.roll_over()
+            bucket = self.entries.setdefault((post_url, interaction_type), [])
+            bucket.append({'hash': image_hash, 'digest': image_digest, 'signature': signature,
+                           'interaction_id': interaction_id, 'uploaded_at': uploaded_at})
+            if len(bucket) > self.max_per_post:
+                bucket.pop(0)
+
+    # undone uploads shouldn't block uploading the same screenshot again
+    def forget(self, interaction_ids):
+        interaction_ids = set(interaction_ids)
+        with self.lock:
+            for key, bucket in self.entries.items():
+                self.entries[key] = [entry for entry in bucket if entry['interaction_id'] not in interaction_ids]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,359 @@
+# load test for the API - several "officers" hitting the real app at once with a realistic mix of
+# page loads, leaderboard views, screenshot uploads, undos and exports. OCR is mocked (a fixed
+# delay, like tesseract would take), everything else - locking, matching, persistence - is real.
+# reports requests/sec and p50/p95/p99 latency per endpoint
+#
+#   python loadtest.py                           # 8 users for 20s through the Flask test client
+#   python loadtest.py --users 32 --duration 60
+#   python loadtest.py --server                  # real threaded HTTP server on localhost instead
+#   python loadtest.py --ocr-ms 0 --json after.json
+#
+# runs in a scratch directory, so the real roster/interactions files are never touched
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import benchmark
+import ocr_engine
+import preprocess
+
+LOGIN = {'username': 'loadtest', 'password': 'loadtest-password'}
+HISTORY_DAYS = 90
+
+# (endpoint name, weight) - roughly what a few officers with the page open end up sending:
+# the page polls leaderboard/activity/undo status after every change, uploads are the main job
+WORKLOAD = [
+    ('login', 2),
+    ('roster', 10),
+    ('leaderboard', 20),
+    ('leaderboard_range', 8),
+    ('leaderboard_rank', 6),
+    ('last_activity', 10),
+    ('undo_status', 10),
+    ('analytics', 4),
+    ('process_screenshot', 20),
+    ('undo', 3),
+    ('export', 4),
+]
+
+
+# stands in for tesseract - sleeps like OCR would (the real thing waits on a subprocess or
+# C code, so other threads keep running) and answers with the text the screenshot was drawn from
+class MockEngine:
+    name = 'mock'
+    delay = 0.0
+    texts = {}  # sha1 of the preprocessed image -> text
+
+    def image_to_text(self, image, profile):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.texts.get(hashlib.sha1(image.tobytes()).digest(), '')
+
+
+# screenshots to upload, rendered once up front - the mock engine gets told what each one says
+def build_screenshots(app_mod, roster, count, rng):
+    font = benchmark.load_font(None, 44)
+    screenshots = []
+    for idx in range(count):
+        interaction_type = ('likes', 'likes', 'comments', 'tags')[idx % 4]
+        lines, _ = benchmark.GENERATORS[interaction_type](roster, rng)
+        buffer = io.BytesIO()
+        benchmark.render_screenshot(lines, font).save(buffer, 'PNG')
+        image_bytes = buffer.getvalue()
+
+        settings = app_mod.ocr_profile(interaction_type)['preprocess']
+        image, original_size = preprocess.open_screenshot(image_bytes, settings)
+        prepared = preprocess.prepare_for_ocr(image, original_size, settings)
+        MockEngine.texts[hashlib.sha1(prepared.tobytes()).digest()] = '\n'.join(lines)
+        screenshots.append((interaction_type, image_bytes))
+    return screenshots
+
+
+# some history to look at, spread over the last few months so date ranges have work to do
+def seed_history(app_mod, roster, count, rng):
+    today = date.today()
+    with app_mod.state_write():
+        for _ in range(count):
+            interaction_type = rng.choice(['likes', 'likes', 'comments', 'tags'])
+            members = rng.sample(roster, min(len(roster), rng.randint(1, 10)))
+            day = (today - timedelta(days=rng.randrange(HISTORY_DAYS))).isoformat()
+            app_mod.apply_interaction(interaction_type, f'seed-{rng.randrange(200)}',
+                                      [m['username'] for m in members], 1, day)
+        app_mod.schedule_save('roster')
+    app_mod.save_interactions()
+
+
+def import_app(workdir, ocr_seconds, use_cache):
+    os.environ.setdefault('IG_STORAGE', 'files')
+    os.environ.setdefault('IG_LOG_LEVEL', 'WARNING')  # one info line per upload would swamp the output
+    os.chdir(workdir)
+    ocr_engine.ENGINES['mock'] = MockEngine
+    MockEngine.delay = ocr_seconds
+    import IG_point_tracking as app_mod
+    # the scratch directory is gone by exit time - no shutdown save into wherever we are then
+    app_mod.start(save_at_exit=False)
+
+    app_mod.OCR_ENGINE = 'mock'
+    for profile in app_mod.OCR_PROFILES.values():
+        profile['engine'] = 'mock'
+    if not use_cache:
+        app_mod.OCR_CACHE_DIR = None
+    return app_mod
+
+
+# same request interface over the Flask test client or a real HTTP connection
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None):
+        response = self.client.open(path, method=method, json=json_body, data=form,
+                                    content_type='multipart/form-data' if form else None)
+        response.get_data()
+        return response.status_code
+
+
+class HTTPSession:
+    def __init__(self, port):
+        self.port = port
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, json_body=None, form=None):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            body, headers['Content-Type'] = encode_multipart(form)
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # server closed the keep-alive connection - reconnect once
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+
+def encode_multipart(form):
+    boundary = f'loadtest{random.getrandbits(64):x}'
+    parts = []
+    for name, value in form.items():
+        if isinstance(value, tuple):
+            stream, filename = value
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                         f'Content-Type: image/png\r\n\r\n'.encode() + stream.getvalue() + b'\r\n')
+        else:
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# one simulated officer - picks endpoints by weight until time is up
+# returns [(endpoint, seconds, status), ...]
+def run_user(session, screenshots, roster, deadline, seed):
+    rng = random.Random(seed)
+    names = [name for name, _ in WORKLOAD]
+    weights = [weight for _, weight in WORKLOAD]
+    samples = []
+    session.request('POST', '/api/login', json_body=LOGIN)
+
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        if endpoint == 'login':
+            status = session.request('POST', '/api/login', json_body=LOGIN)
+        elif endpoint == 'roster':
+            status = session.request('GET', '/api/roster')
+        elif endpoint == 'leaderboard':
+            status = session.request('GET', '/api/leaderboard')
+        elif endpoint == 'leaderboard_range':
+            start = date.today() - timedelta(days=rng.randrange(HISTORY_DAYS))
+            end = start + timedelta(days=rng.randrange(1, 30))
+            status = session.request('GET', '/api/leaderboard?' + urlencode({'start_date': start.isoformat(), 'end_date': end.isoformat()}))
+        elif endpoint == 'leaderboard_rank':
+            status = session.request('GET', f"/api/leaderboard/rank/{rng.choice(roster)['username']}?around=2")
+        elif endpoint == 'last_activity':
+            status = session.request('GET', '/api/last-activity')
+        elif endpoint == 'undo_status':
+            status = session.request('GET', '/api/undo-status')
+        elif endpoint == 'analytics':
+            status = session.request('GET', '/api/analytics')
+        elif endpoint == 'process_screenshot':
+            interaction_type, image_bytes = rng.choice(screenshots)
+            # a fresh post each time so the duplicate check doesn't turn most uploads away
+            status = session.request('POST', '/api/process-screenshot', form={
+                'image': (io.BytesIO(image_bytes), 'screenshot.png'),
+                'type': interaction_type,
+                'post_url': f'https://instagram.com/p/load{rng.getrandbits(48):x}'
+            })
+        elif endpoint == 'undo':
+            status = session.request('POST', '/api/undo')
+        else:
+            status = session.request('GET', '/api/export')
+        samples.append((endpoint, time.perf_counter() - started, status))
+    return samples
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log line per request
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# 2xx/304 are fine, and so is undo with nothing left to undo - anything else is an error
+def is_error(endpoint, status):
+    if endpoint == 'undo' and status == 400:
+        return False
+    return not (200 <= status < 300 or status == 304)
+
+
+def summarize(samples, elapsed):
+    by_endpoint = {}
+    for endpoint, seconds, status in samples:
+        row = by_endpoint.setdefault(endpoint, {'latencies': [], 'errors': 0, 'statuses': {}})
+        row['latencies'].append(seconds)
+        row['errors'] += is_error(endpoint, status)
+        row['statuses'][str(status)] = row['statuses'].get(str(status), 0) + 1
+
+    def stats(latencies, errors):
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'per_second': len(latencies) / elapsed,
+            'p50_ms': 1000 * benchmark.percentile(latencies, 50),
+            'p95_ms': 1000 * benchmark.percentile(latencies, 95),
+            'p99_ms': 1000 * benchmark.percentile(latencies, 99),
+            'max_ms': 1000 * max(latencies)
+        }
+
+    endpoints = {
+        endpoint: dict(stats(row['latencies'], row['errors']), statuses=row['statuses'])
+        for endpoint, row in sorted(by_endpoint.items())
+    }
+    overall = stats([s[1] for s in samples], sum(row['errors'] for row in by_endpoint.values())) if samples else {}
+    return endpoints, overall
+
+
+def print_report(results):
+    print(f"{results['users']} users for {results['elapsed']:.1f}s via {results['mode']}, "
+          f"{results['roster_size']} members, {results['history']} seeded interactions, mock OCR {results['ocr_ms']}ms")
+    print()
+    print(f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = list(results['endpoints'].items()) + [('overall', results['overall'])]
+    for endpoint, row in rows:
+        if endpoint == 'overall':
+            print()
+        print(f"{endpoint:<20}{row['requests']:>10}{row['errors']:>8}{row['per_second']:>9.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    unexpected = {endpoint: row['statuses'] for endpoint, row in results['endpoints'].items() if row['errors']}
+    if unexpected:
+        print()
+        print('status codes where something failed: ' + json.dumps(unexpected))
+
+
+def run_load_test(args):
+    rng = random.Random(args.seed)
+    roster = benchmark.generate_roster(args.roster, rng)
+    workdir = tempfile.mkdtemp(prefix='ig_loadtest_')
+    cwd = os.getcwd()
+    server = None
+    try:
+        app_mod = import_app(workdir, args.ocr_ms / 1000.0, args.ocr_cache)
+        app_mod.roster[:] = [dict(member) for member in roster]
+        app_mod.rebuild_roster_index()
+        seed_history(app_mod, roster, args.history, rng)
+        screenshots = build_screenshots(app_mod, roster, args.screenshots, rng)
+
+        if args.server:
+            server = start_server(app_mod.app)
+            make_session = lambda: HTTPSession(server.server_port)
+        else:
+            make_session = lambda: TestClientSession(app_mod.app)
+        # the first login creates the account - do it before everyone piles in
+        make_session().request('POST', '/api/login', json_body=LOGIN)
+
+        results = [None] * args.users
+        deadline = time.perf_counter() + args.duration
+
+        def user(idx):
+            results[idx] = run_user(make_session(), screenshots, roster, deadline, args.seed + idx)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=user, args=(idx,)) for idx in range(args.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        app_mod.flush_dirty()
+    finally:
+        if server is not None:
+            server.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    samples = [sample for user_samples in results if user_samples for sample in user_samples]
+    endpoints, overall = summarize(samples, elapsed)
+    return {
+        'users': args.users,
+        'mode': 'local HTTP server' if args.server else 'Flask test client',
+        'elapsed': elapsed,
+        'roster_size': len(roster),
+        'history': args.history,
+        'ocr_ms': args.ocr_ms,
+        'endpoints': endpoints,
+        'overall': overall
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API with concurrent simulated users and mocked OCR')
+    parser.add_argument('--users', type=int, default=8, help='simulated officers sending requests at once')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run for')
+    parser.add_argument('--server', action='store_true', help='go through a real threaded HTTP server on localhost')
+    parser.add_argument('--roster', type=int, default=300, help='members in the generated roster')
+    parser.add_argument('--history', type=int, default=2000, help='interactions seeded before the test starts')
+    parser.add_argument('--screenshots', type=int, default=24, help='distinct screenshots to upload (rendered up front)')
+    parser.add_argument('--ocr-ms', type=float, default=250, help='how long each mocked OCR call takes')
+    parser.add_argument('--ocr-cache', action='store_true', help='let repeat screenshots come out of the OCR cache')
+    parser.add_argument('--seed', type=int, default=352)
+    parser.add_argument('--json', help='also write the results to this file (handy for before/after diffs)')
+    args = parser.parse_args()
+
+    results = run_load_test(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if results['overall'].get('errors'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
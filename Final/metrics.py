@@ -0,0 +1,103 @@
+# tiny Prometheus-style metrics for the IG point tracker
+# just counters + histograms kept in memory, rendered in the Prometheus text format
+# by /api/metrics - no extra packages needed
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds - OCR on a phone screenshot lands somewhere in the 0.1-5s range
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = []
+registry_lock = threading.Lock()
+
+
+def format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Counter:
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values = {}  # label values tuple -> count
+        self.lock = threading.Lock()
+        with registry_lock:
+            registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.values.items())
+        if not items and not self.label_names:
+            items = [((), 0)]
+        for key, value in items:
+            lines.append(f'{self.name}{format_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values tuple -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        with registry_lock:
+            registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    # with stage_seconds.time(stage='ocr'): ...
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            items = sorted((key, list(series)) for key, series in self.series.items())
+        for key, series in items:
+            for i, bound in enumerate(self.buckets):
+                lines.append(f'{self.name}_bucket{format_labels(self.label_names, key, ("le", bound))} {series[i]}')
+            lines.append(f'{self.name}_bucket{format_labels(self.label_names, key, ("le", "+Inf"))} {series[-1]}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, key)} {series[-2]}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, key)} {series[-1]}')
+        return lines
+
+
+# everything registered so far, in the Prometheus text exposition format
+def render_all():
+    with registry_lock:
+        metrics = list(registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
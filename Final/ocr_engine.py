@@ -0,0 +1,134 @@
+# OCR engines for the screenshot pipeline
+#   pytesseract - runs the tesseract command once per image (new process + model load every time)
+#   tesserocr   - keeps tesseract loaded inside this process, way faster per image
+#                 (pip install tesserocr - needs the tesseract dev libraries)
+# both take the same profile dict: {'lang': 'eng', 'psm': 3, 'whitelist': None}
+import os
+import queue
+import shutil
+import threading
+from contextlib import contextmanager
+
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None  # only pytesseract available
+
+# where tesseract usually ends up if it isn't on PATH (homebrew on M1/M2 + Intel macs, linux packages)
+TESSERACT_LOCATIONS = ['/opt/homebrew/bin/tesseract', '/usr/local/bin/tesseract', '/usr/bin/tesseract']
+
+# most loaded tesseract APIs kept per language - about one per core is all that can run at once,
+# and each one holds its own copy of the model in memory
+API_POOL_SIZE = max(2, os.cpu_count() or 2)
+
+
+# TESSERACT_CMD env var wins, then PATH, then the usual install spots
+def find_tesseract():
+    configured = os.environ.get('TESSERACT_CMD')
+    if configured:
+        return configured
+    found = shutil.which('tesseract')
+    if found:
+        return found
+    for path in TESSERACT_LOCATIONS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class PytesseractEngine:
+    name = 'pytesseract'
+
+    def __init__(self):
+        tesseract_cmd = find_tesseract()
+        if tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def image_to_text(self, image, profile):
+        config = []
+        if profile.get('psm') is not None:
+            config.append(f"--psm {profile['psm']}")
+        if profile.get('whitelist'):
+            config.append(f"-c tessedit_char_whitelist={profile['whitelist']}")
+        return pytesseract.image_to_string(image, lang=profile['lang'], config=' '.join(config))
+
+
+class TesserocrEngine:
+    name = 'tesserocr'
+
+    def __init__(self, pool_size=API_POOL_SIZE):
+        if tesserocr is None:
+            raise RuntimeError('tesserocr is not installed')
+        # a tesseract API object can't be used by two threads at once, so each call checks one
+        # out of a per-language pool and hands it back after. not per thread - the dev server
+        # starts a fresh thread for every request, which would load the model every time
+        self.pool_size = pool_size
+        self.idle = {}  # lang -> loaded APIs nobody is using right now
+        self.created = {}  # lang -> how many APIs exist (idle or checked out)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def api(self, lang):
+        with self.lock:
+            idle = self.idle.setdefault(lang, queue.LifoQueue())
+            try:
+                api = idle.get_nowait()
+            except queue.Empty:
+                api = None
+                create = self.created.get(lang, 0) < self.pool_size
+                if create:
+                    self.created[lang] = self.created.get(lang, 0) + 1
+
+        if api is None:
+            if create:
+                try:
+                    api = tesserocr.PyTessBaseAPI(lang=lang)
+                except Exception:
+                    with self.lock:
+                        self.created[lang] -= 1
+                    raise
+            else:
+                api = idle.get()  # all of them busy - wait for one to come back
+        try:
+            yield api
+        finally:
+            idle.put(api)
+
+    def image_to_text(self, image, profile):
+        with self.api(profile['lang']) as api:
+            psm = profile.get('psm')
+            api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+            api.SetVariable('tessedit_char_whitelist', profile.get('whitelist') or '')
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+
+ENGINES = {'pytesseract': PytesseractEngine, 'tesserocr': TesserocrEngine}
+
+# one engine per name per process - pool workers build their own after the fork
+engine_cache = {}
+engine_cache_pid = None
+engine_cache_lock = threading.Lock()
+
+
+# 'auto' = tesserocr when it's installed, otherwise pytesseract
+def resolve_engine_name(name):
+    if name == 'auto':
+        return 'tesserocr' if tesserocr is not None else 'pytesseract'
+    if name not in ENGINES:
+        raise ValueError(f"unknown OCR engine '{name}' (expected one of: auto, {', '.join(ENGINES)})")
+    return name
+
+
+def get_engine(name):
+    global engine_cache_pid
+    name = resolve_engine_name(name)
+    with engine_cache_lock:
+        if engine_cache_pid != os.getpid():
+            engine_cache.clear()
+            engine_cache_pid = os.getpid()
+        if name not in engine_cache:
+            engine_cache[name] = ENGINES[name]()
+        return engine_cache[name]
@@ -0,0 +1,127 @@
+# turns raw OCR text from a screenshot into the date, tag count and candidate usernames
+# everything is precompiled and the text is only scanned once for dates + tags, then split
+# into lines once for usernames - this is the hot path whenever the OCR text is a cache hit
+#
+# gives exactly the same answers as the old inline version in IG_point_tracking.py
+import re
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    from dateutil import parser as date_parser
+except ImportError:
+    date_parser = None  # will skip date extraction if not installed
+
+# one pattern for everything we count or pull out of the full text. the alternatives can't
+# overlap each other, so a single finditer sees every match each separate search would have.
+# the lookahead lets the regex engine skip any position that can't start a match
+TEXT_PATTERN = re.compile(
+    r'(?=[adfjmnost])(?:'
+    r'(?P<date>(?P<month>Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?'
+    r'|Sep(?:tember)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)\s+\d{1,2})'
+    r'|(?P<mention>mentioned\s+you\s+in\s+(?:their|a)\s+story)'
+    r'|(?P<post_tag>tagged\s+you\s+in\s+(?:a|their)\s+post))',
+    re.IGNORECASE
+)
+
+# UI text at the top of a tag notification that is never the username
+# (the fallback list is the same minus 'notification')
+SKIP_LINE = re.compile(r'mentioned|tagged|story|post|notification|at |pm|am|sep|oct|nov|dec')
+SKIP_LINE_FALLBACK = re.compile(r'mentioned|tagged|story|post|sep|oct|nov|dec|at |pm|am')
+HAS_ALNUM = re.compile(r'[^\W_]')  # same characters str.isalnum() accepts
+
+HANDLE_STRIP = '@.,!?(){}[]"\''
+WORD_STRIP = '@.,!?(){}[]'
+TAG_HANDLE_LINES = 10  # instagram puts the username in the first few lines
+TAG_FALLBACK_LINES = 5
+
+
+# the same few dates show up in every screenshot from a post, and dateutil is slow
+@lru_cache(maxsize=1024)
+def parse_date(date_text, year):
+    if not date_parser:
+        return None
+    try:
+        return date_parser.parse(f"{date_text} {year}").date().isoformat()
+    except (ValueError, OverflowError):
+        return None
+
+
+def scan_text(text):
+    # returns (date string or None, story mentions, post tags)
+    # a short month name ("Dec 17") anywhere beats a full one ("December 17"), same as before
+    short_date = full_date = None
+    story_mentions = post_tags = 0
+    for match in TEXT_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == 'mention':
+            story_mentions += 1
+        elif kind == 'post_tag':
+            post_tags += 1
+        elif len(match.group('month')) == 3:  # "May" counts as short
+            if short_date is None:
+                short_date = match.group()
+        elif full_date is None:
+            full_date = match.group()
+    return short_date or full_date, story_mentions, post_tags
+
+
+def tag_handle_candidates(lines):
+    first_lines = lines[:TAG_HANDLE_LINES]
+
+    # look specifically for the @handle (or a handle starting with _)
+    for line in first_lines:
+        line = line.strip()
+        if len(line) < 2 or SKIP_LINE.search(line.lower()):
+            continue
+        if line.startswith('_') or '@' in line:
+            clean_word = line.strip(HANDLE_STRIP).strip()
+            if clean_word and 2 <= len(clean_word) <= 30:
+                return [clean_word]
+
+    # still nothing - take the first word that looks like a handle
+    for line in first_lines[:TAG_FALLBACK_LINES]:
+        line = line.strip()
+        if not line or SKIP_LINE_FALLBACK.search(line.lower()):
+            continue
+        for word in line.split():
+            clean_word = word.strip(HANDLE_STRIP)
+            if clean_word and 2 <= len(clean_word) <= 30:
+                handle_chars = sum(c.isalnum() or c in '._' for c in clean_word)
+                if handle_chars >= len(clean_word) * 0.8:
+                    return [clean_word]
+    return []
+
+
+def word_candidates(lines):
+    candidates = []
+    for line in lines:
+        if '@' in line or HAS_ALNUM.search(line):
+            for word in line.split():
+                clean_word = word.strip(WORD_STRIP)
+                if len(clean_word) > 2:
+                    candidates.append(clean_word)
+    return candidates
+
+
+# pulls the date, tag count and candidate usernames out of the OCR text
+def parse_screenshot_text(text, interaction_type, manual_username=''):
+    date_text, story_mentions, post_tags = scan_text(text)
+    total_tag_occurrences = story_mentions + post_tags
+
+    # if manual username provided, use that instead of OCR
+    if manual_username and interaction_type == 'tags':
+        potential_usernames = [manual_username]
+    elif interaction_type == 'tags' and total_tag_occurrences > 0:
+        potential_usernames = tag_handle_candidates(text.split('\n'))
+    else:
+        # likes/comments - every word in the text could be a username
+        potential_usernames = word_candidates(text.split('\n'))
+
+    return {
+        'extracted_date': parse_date(date_text, datetime.now().year) if date_text else None,
+        'total_tag_occurrences': total_tag_occurrences,
+        'story_mentions': story_mentions,
+        'post_tags': post_tags,
+        'potential_usernames': potential_usernames
+    }
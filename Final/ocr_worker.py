@@ -0,0 +1,97 @@
+# the OCR step on its own - what the batch process pool runs in its worker processes
+# nothing happens at import here (no data loading, no threads, no atexit hooks), so a pool
+# started with spawn/forkserver can import this without a second copy of the app coming up.
+# everything a worker needs comes in as arguments, since settings changed in the parent
+# after startup wouldn't exist in a freshly started worker
+import hashlib
+import json
+import os
+import time
+
+import ocr_engine
+import preprocess
+from atomicfile import atomic_open
+
+CACHE_MAX_BYTES = 20 * 1024 * 1024  # ~20MB of cached OCR text before we start evicting
+
+
+# cache key = sha256 of the image bytes + the OCR settings (so changing settings won't reuse old text)
+def cache_key(image_bytes, profile):
+    digest = hashlib.sha256(image_bytes)
+    digest.update(("\0" + json.dumps(profile, sort_keys=True)).encode())
+    return digest.hexdigest()
+
+
+# looks up cached OCR text, marking the entry as recently used
+def cache_get(cache_dir, key):
+    path = os.path.join(cache_dir, key + '.txt')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path)  # bump mtime - that's our LRU clock
+    except OSError:
+        pass
+    return text
+
+
+# saves OCR text to the cache, then trims the oldest entries if we're over the size cap
+def cache_put(cache_dir, key, text):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.txt')
+    # write to a temp file first so another worker never reads half an entry
+    with atomic_open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    entries = []
+    total_size = 0
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.txt'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+    if total_size <= CACHE_MAX_BYTES:
+        return
+
+    # least recently used first
+    entries.sort()
+    for mtime, size, entry_path in entries:
+        if total_size <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(entry_path)
+            total_size -= size
+        except OSError:
+            pass  # another worker got to it first
+
+
+# runs OCR on the raw bytes of one screenshot with a resolved profile (see ocr_profile() in
+# the app), returns (text, timings) - timings come back with the text since metrics recorded
+# in a pool process would never reach /api/metrics. cache_dir=None skips the cache
+def run_ocr(image_bytes, profile, cache_dir=None):
+    # re-uploads of the same screenshot skip tesseract completely
+    key = cache_key(image_bytes, profile) if cache_dir else None
+    if key:
+        cached = cache_get(cache_dir, key)
+        if cached is not None:
+            return cached, {'cache_hit': True}
+
+    start = time.perf_counter()
+    image, original_size = preprocess.open_screenshot(image_bytes, profile['preprocess'])
+    decoded = time.perf_counter()
+    image = preprocess.prepare_for_ocr(image, original_size, profile['preprocess'])
+    prepared = time.perf_counter()
+    text = ocr_engine.get_engine(profile['engine']).image_to_text(image, profile)
+    finished = time.perf_counter()
+    if key:
+        cache_put(cache_dir, key, text)
+    return text, {
+        'cache_hit': False,
+        'decode': decoded - start,
+        'preprocess': prepared - decoded,
+        'ocr': finished - prepared,
+        'original_pixels': original_size[0] * original_size[1],
+        'ocr_pixels': image.size[0] * image.size[1]
+    }
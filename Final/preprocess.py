@@ -0,0 +1,80 @@
+# shrinks a screenshot before it goes to tesseract - phone screenshots are 1000+ px wide
+# with a status bar, avatars and buttons, and tesseract only needs the text at a decent size
+#   grayscale  - one channel instead of three (jpegs get decoded straight to grayscale)
+#   downscale  - text ends up about target_text_height px tall, never scaled up
+#   jpeg draft - jpegs are decoded at a reduced size instead of full size then shrunk
+#   crop       - only the part of the screen the usernames are in
+# crop and downscale are worked out as fractions of a whole phone screen, so they only run
+# on images that look like one - a screenshot already cropped to the list would lose the
+# start of every username, and a wide desktop capture would get its text shrunk to a few px
+import io
+
+from PIL import Image
+
+RESAMPLE_FILTERS = {'box': Image.BOX, 'bilinear': Image.BILINEAR, 'lanczos': Image.LANCZOS}
+
+# what a whole phone screenshot looks like: portrait, 16:9 up to 21.5:9, and at least 1000px
+# wide (every current iphone/pixel/galaxy screenshot is 1080-1440). narrower phones (750/828px)
+# just skip the crop - their text is already under target_text_height, so there'd be no
+# downscale anyway - and that also keeps a list cropped out of a bigger screenshot intact
+PHONE_ASPECT_RANGE = (1.7, 2.4)  # height / width
+PHONE_MIN_WIDTH = 1000
+
+# instagram body text is about 3.5% of the screen width tall on every phone we've seen
+DEFAULT_PREPROCESS = {
+    'enabled': True,
+    'grayscale': True,
+    'jpeg_draft': True,
+    'target_text_height': 32,  # px - tesseract is happiest around 30px text, 0 = don't resize
+    'text_height_ratio': 0.035,
+    'resample': 'bilinear',  # about half the cost of lanczos, text edges barely differ at these scales
+    'crop': None  # (left, top, right, bottom) as fractions of the screenshot
+}
+
+
+def is_phone_screenshot(size):
+    width, height = size
+    return width >= PHONE_MIN_WIDTH and PHONE_ASPECT_RANGE[0] <= height / width <= PHONE_ASPECT_RANGE[1]
+
+
+def target_scale(size, settings):
+    if not settings['target_text_height'] or not is_phone_screenshot(size):
+        return 1.0
+    text_height = size[0] * settings['text_height_ratio']
+    return min(1.0, settings['target_text_height'] / text_height) if text_height else 1.0
+
+
+# decodes the screenshot - returns (image, original size)
+def open_screenshot(image_bytes, settings):
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+    if settings['enabled'] and settings['jpeg_draft'] and image.format == 'JPEG':
+        scale = target_scale(original_size, settings)
+        mode = 'L' if settings['grayscale'] else image.mode
+        # draft only picks from 1/2, 1/4, 1/8 and always stays at least this big
+        image.draft(mode, (max(1, int(original_size[0] * scale)), max(1, int(original_size[1] * scale))))
+    image.load()  # Image.open is lazy - force the actual decode here so it's timed separately
+    return image, original_size
+
+
+# crop -> grayscale -> downscale, cheapest order since each step shrinks the next one's input
+def prepare_for_ocr(image, original_size, settings):
+    if not settings['enabled']:
+        return image
+
+    crop = settings.get('crop') if is_phone_screenshot(original_size) else None
+    if crop:
+        width, height = image.size
+        image = image.crop((round(crop[0] * width), round(crop[1] * height),
+                            round(crop[2] * width), round(crop[3] * height)))
+
+    if settings['grayscale'] and image.mode != 'L':
+        image = image.convert('L')
+
+    # work out the final size from the original, the draft decode may already be partway there
+    scale = target_scale(original_size, settings)
+    crop_width, crop_height = (crop[2] - crop[0], crop[3] - crop[1]) if crop else (1.0, 1.0)
+    target = (max(1, round(original_size[0] * crop_width * scale)), max(1, round(original_size[1] * crop_height * scale)))
+    if image.size[0] > target[0]:
+        image = image.resize(target, RESAMPLE_FILTERS[settings['resample']])
+    return image
@@ -0,0 +1,187 @@
+# keeps the roster in leaderboard order as points change, instead of sorting everyone on every request
+# an indexable skip list (each link knows how many members it jumps over) gives O(log n) for
+#   moving a member when their points change, "what rank is X", and "who is at rank N"
+# ties stay in roster order, same as sorted() on the roster list always gave
+import random
+
+MAX_LEVELS = 20  # plenty up to about a million members
+BOTTOM = 0
+
+
+class Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels  # members skipped by following next[level], counting the target
+
+
+# sorted collection of unique, comparable keys with lookup by position
+class IndexableSkipList:
+    def __init__(self):
+        self.max_levels = MAX_LEVELS
+        self.head = Node(None, self.max_levels)
+        self.size = 0
+        self.random = random.Random()
+
+    def __len__(self):
+        return self.size
+
+    def random_levels(self):
+        levels = 1
+        while levels < self.max_levels and self.random.random() < 0.5:
+            levels += 1
+        return levels
+
+    # last node before key on every level, plus its position (1-based, head = 0)
+    def find_path(self, key):
+        path = [None] * self.max_levels
+        positions = [0] * self.max_levels
+        node = self.head
+        position = 0
+        for level in range(self.max_levels - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            path[level] = node
+            positions[level] = position
+        return path, positions
+
+    # fills an empty list from already sorted keys in one pass (much faster than inserting one by one)
+    def extend_sorted(self, keys):
+        tails = [self.head] * self.max_levels  # last node on each level so far
+        tail_positions = [0] * self.max_levels
+        for position, key in enumerate(keys, start=1):
+            node = Node(key, self.random_levels())
+            for level in range(len(node.next)):
+                tails[level].next[level] = node
+                tails[level].width[level] = position - tail_positions[level]
+                tails[level] = node
+                tail_positions[level] = position
+            self.size += 1
+
+    def insert(self, key):
+        path, positions = self.find_path(key)
+        levels = self.random_levels()
+        node = Node(key, levels)
+        position = positions[BOTTOM] + 1  # where the new node ends up
+        for level in range(self.max_levels):
+            previous = path[level]
+            if level < levels:
+                skipped = position - positions[level]  # from previous to the new node
+                node.next[level] = previous.next[level]
+                node.width[level] = previous.width[level] - skipped + 1
+                previous.next[level] = node
+                previous.width[level] = skipped
+            else:
+                previous.width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        path, _ = self.find_path(key)
+        node = path[BOTTOM].next[BOTTOM]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(self.max_levels):
+            previous = path[level]
+            if previous.next[level] is node:
+                previous.width[level] += node.width[level] - 1
+                previous.next[level] = node.next[level]
+            else:
+                previous.width[level] -= 1
+        self.size -= 1
+
+    # 0-based position of key
+    def index(self, key):
+        path, positions = self.find_path(key)
+        node = path[BOTTOM].next[BOTTOM]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        return positions[BOTTOM]
+
+    # keys from position start (0-based) onwards, up to count of them
+    def slice(self, start, count):
+        if start < 0 or start >= self.size or count <= 0:
+            return []
+        node = self.head
+        remaining = start + 1  # walk to the node at position start (1-based from the head)
+        for level in range(self.max_levels - 1, -1, -1):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[BOTTOM]
+        return keys
+
+    def __iter__(self):
+        node = self.head.next[BOTTOM]
+        while node is not None:
+            yield node.key
+            node = node.next[BOTTOM]
+
+
+# the live leaderboard - holds the roster's member dicts, ranked by total_points (highest first)
+# not thread safe on its own, it lives under the app's state lock like the roster does
+class Leaderboard:
+    def __init__(self):
+        self.entries = IndexableSkipList()
+        self.keys = {}  # id(member) -> its key in entries
+        self.members = {}  # roster position counter -> member
+        self.next_seq = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # starts over from the roster list (after a load, a CSV upload, a delete...)
+    def rebuild(self, roster):
+        self.keys.clear()
+        self.members.clear()
+        for seq, member in enumerate(roster):
+            key = (-member['total_points'], seq)
+            self.keys[id(member)] = key
+            self.members[seq] = member
+        self.next_seq = len(roster)
+        self.entries = IndexableSkipList()
+        self.entries.extend_sorted(sorted(self.keys.values()))
+
+    def add(self, member):
+        key = (-member['total_points'], self.next_seq)
+        self.next_seq += 1
+        self.keys[id(member)] = key
+        self.members[key[1]] = member
+        self.entries.insert(key)
+
+    # call after changing member['total_points']
+    def update(self, member):
+        key = self.keys.get(id(member))
+        if key is None or -key[0] == member['total_points']:
+            return
+        self.entries.remove(key)
+        key = (-member['total_points'], key[1])  # keeps its place among ties
+        self.keys[id(member)] = key
+        self.entries.insert(key)
+
+    # 1-based rank, or None for someone not on the leaderboard
+    def rank(self, member):
+        key = self.keys.get(id(member))
+        return None if key is None else self.entries.index(key) + 1
+
+    # members ranked start+1 .. start+count
+    def page(self, start, count):
+        return [self.members[key[1]] for key in self.entries.slice(start, count)]
+
+    def top(self, count=None):
+        if count is None:
+            return [self.members[key[1]] for key in self.entries]
+        return self.page(0, count)
+
+    # (rank of the first member returned, members ranked within radius of member)
+    def around(self, member, radius):
+        rank = self.rank(member)
+        if rank is None:
+            return None, []
+        start = max(0, rank - 1 - radius)
+        return start + 1, self.page(start, rank - start + radius)
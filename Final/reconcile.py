@@ -0,0 +1,329 @@
+# offline consistency check - recomputes every member's likes/comments/tags/points from the
+# interaction history and compares them with the totals saved in the roster
+# the roster totals get changed in place by every upload, undo and reset, so they can drift
+# from what the history says; this finds out by how much (and can write the rebuilt numbers back)
+#
+#   python reconcile.py                         # check the CSV/JSON files in this folder
+#   python reconcile.py --sqlite ig_points.db   # check the sqlite database instead
+#   python reconcile.py --write                 # fix the roster file (stop the app first!)
+#   python reconcile.py --synthetic 5000000     # time it on 5M made-up interactions
+#
+# exits with 1 when something doesn't match, so it can run from cron
+#
+# tags: the history only records who was tagged, not how many times the screenshot said so,
+# but an upload gives 5 pts per "tagged you" line. a member whose extra tags are exactly
+# 5 pts each is reported as "explained" (multi-tag screenshots) instead of as drift
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from atomicfile import atomic_open
+
+# same scoring and files as IG_point_tracking.py (add_to_daily_points)
+POINTS = {'likers': 1, 'commenters': 1, 'tagged_users': 5}
+MAX_POINTS_PER_COMMENT = 4
+ROSTER_FILE = 'F25IGPointTracking - Sheet1.csv'
+INTERACTIONS_FILE = 'interactions.json'
+INTERACTIONS_LOG_FILE = 'interactions.log.jsonl'
+
+TYPES = ['likes', 'comments', 'tags']
+TYPE_CODES = {interaction_type: code for code, interaction_type in enumerate(TYPES)}
+FIELDS = ['likes', 'comments', 'tags', 'total_points']
+
+
+# snapshot + replayed log, the same way the app loads it at startup
+def load_interactions_from_files():
+    interactions = []
+    snapshot_seq = 0
+    if os.path.exists(INTERACTIONS_FILE):
+        with open(INTERACTIONS_FILE, 'r') as f:
+            snapshot = json.load(f)
+        if isinstance(snapshot, list):
+            interactions = snapshot
+        else:
+            interactions = snapshot['interactions']
+            snapshot_seq = snapshot.get('log_seq', 0)
+
+    if os.path.exists(INTERACTIONS_LOG_FILE):
+        with open(INTERACTIONS_LOG_FILE, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # damaged line from a crash - same as the app, skip just that one
+                if event['seq'] <= snapshot_seq:
+                    continue
+                if event['op'] == 'add':
+                    interactions.append(event['interaction'])
+                elif event['op'] == 'remove':
+                    for removed in event['interactions']:
+                        remove_interaction(interactions, removed)
+                elif event['op'] == 'clear':
+                    interactions = []
+    return interactions
+
+
+# same as the app's remove_interaction - by id, searching back from the end where undone uploads are
+def remove_interaction(interactions, removed):
+    removed_id = removed.get('id')
+    for idx in range(len(interactions) - 1, -1, -1):
+        if (interactions[idx].get('id') == removed_id) if removed_id else interactions[idx] == removed:
+            del interactions[idx]
+            return
+
+
+def load_roster_from_file():
+    rows = []
+    with open(ROSTER_FILE, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            rows.append({
+                'first_name': row.get('First Name', row.get('first_name', '')),
+                'last_name': row.get('Last Name', row.get('last_name', '')),
+                'username': row.get('Username', row.get('username', '')).lower().strip().replace('@', ''),
+                **{field: int(row.get(field) or 0) for field in FIELDS}
+            })
+    return rows
+
+
+# one row per (interaction, username) - the columns everything else is computed from
+def interactions_to_columns(interactions):
+    usernames = [interaction['usernames'] for interaction in interactions]
+    lengths = np.fromiter(map(len, usernames), dtype=np.int64, count=len(usernames))
+    type_codes = np.fromiter((TYPE_CODES.get(interaction['type'], -1) for interaction in interactions),
+                             dtype=np.int8, count=len(interactions))
+    user_codes, user_names = pd.factorize(pd.Series(list(chain.from_iterable(usernames)), dtype=object))
+    return {
+        'interaction': np.repeat(np.arange(len(interactions), dtype=np.int64), lengths),
+        'type': np.repeat(type_codes, lengths),  # -1 = unknown type, ignored
+        'user': user_codes.astype(np.int64),
+        'user_names': np.asarray(user_names, dtype=object)
+    }
+
+
+# likes/comments/tags/points per username, scored exactly like the app does per interaction:
+# every time a name appears it gets its type's points, and a commenter listed c times in one
+# interaction is credited c comments (and min(c, 4) pts) per appearance
+def recompute_totals(columns):
+    user_names = columns['user_names']
+    n_users = len(user_names)
+    empty = pd.DataFrame(0, index=pd.Index(user_names, name='username'), columns=FIELDS, dtype=np.int64)
+    if n_users == 0 or len(columns['user']) == 0:
+        return empty
+
+    users, types = columns['user'], columns['type']
+
+    def per_user(selected_users, weights=None):
+        return np.bincount(selected_users, weights=weights, minlength=n_users).astype(np.int64)
+
+    # likes and tags are one per appearance, so a plain count per user is enough
+    likes = per_user(users[types == TYPE_CODES['likes']])
+    tags = per_user(users[types == TYPE_CODES['tags']])
+
+    # comments depend on how many times the name is in that interaction: (interaction, user) -> c
+    is_comments = types == TYPE_CODES['comments']
+    pair_keys = columns['interaction'][is_comments] * n_users + users[is_comments]
+    pairs, repeats = np.unique(pair_keys, return_counts=True)
+    pair_users = pairs % n_users
+    comments = per_user(pair_users, repeats * repeats)
+    comment_points = per_user(pair_users, repeats * np.minimum(repeats, MAX_POINTS_PER_COMMENT))
+
+    totals = empty
+    totals['likes'] = likes
+    totals['comments'] = comments
+    totals['tags'] = tags
+    totals['total_points'] = (likes * POINTS['likers'] + comment_points * POINTS['commenters']
+                              + tags * POINTS['tagged_users'])
+    return totals
+
+
+# lines up the roster with the recomputed totals and works out what doesn't match
+def compare(roster, totals):
+    saved = pd.DataFrame(roster, columns=['first_name', 'last_name', 'username'] + FIELDS)
+    saved = saved.drop_duplicates('username')  # first one wins, same as the app's lookup
+    merged = saved.join(totals, on='username', rsuffix='_log')
+    log_columns = [f'{field}_log' for field in FIELDS]
+    merged[log_columns] = merged[log_columns].fillna(0).astype(np.int64)
+
+    diffs = pd.DataFrame({field: merged[field] - merged[f'{field}_log'] for field in FIELDS})
+    # extra tags worth exactly 5 pts each, with likes + comments matching = multi-tag screenshots
+    explained = ((diffs['tags'] > 0) & (diffs['likes'] == 0) & (diffs['comments'] == 0)
+                 & (diffs['total_points'] == diffs['tags'] * POINTS['tagged_users']))
+    drifted = diffs.ne(0).any(axis=1) & ~explained
+
+    not_on_roster = totals.index.difference(saved['username'])
+    return {
+        'merged': merged,
+        'diffs': diffs,
+        'explained': explained,
+        'drifted': drifted,
+        'not_on_roster': totals.loc[not_on_roster]
+    }
+
+
+# roster with likes/comments from the history, tags from the history plus any explained extras
+def rebuilt_roster(roster, result):
+    merged, explained = result['merged'], result['explained']
+    rebuilt = {}
+    for idx, row in merged.iterrows():
+        extra_tags = int(result['diffs'].at[idx, 'tags']) if explained[idx] else 0
+        likes, comments, tags = row['likes_log'], row['comments_log'], row['tags_log'] + extra_tags
+        rebuilt[row['username']] = {
+            'likes': int(likes),
+            'comments': int(comments),
+            'tags': int(tags),
+            'total_points': int(row['total_points_log']) + extra_tags * POINTS['tagged_users']
+        }
+    return [dict(member, **rebuilt.get(member['username'], {})) for member in roster]
+
+
+def write_roster_file(roster):
+    fieldnames = ['First Name', 'Last Name', 'Username', 'likes', 'comments', 'tags', 'total_points']
+    with atomic_open(ROSTER_FILE, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for member in roster:
+            writer.writerow({
+                'First Name': member['first_name'],
+                'Last Name': member['last_name'],
+                'Username': member['username'],
+                **{field: member[field] for field in FIELDS}
+            })
+
+
+# made-up roster + history for timing - a few members slightly off so there's drift to find
+def synthetic_data(count, roster_size, seed):
+    rng = np.random.default_rng(seed)
+    usernames = [f'member_{i:06d}' for i in range(roster_size)]
+    sizes = rng.integers(1, 12, size=count).tolist()
+    picks = np.take(np.array(usernames, dtype=object), rng.integers(0, roster_size, size=sum(sizes))).tolist()
+    types = rng.choice(TYPES, size=count, p=[0.6, 0.3, 0.1]).tolist()
+    interactions = []
+    start = 0
+    for interaction_type, size in zip(types, sizes):
+        interactions.append({'timestamp': '2025-01-01T12:00:00', 'type': interaction_type, 'usernames': picks[start:start + size]})
+        start += size
+
+    totals = recompute_totals(interactions_to_columns(interactions)).reindex(usernames, fill_value=0)
+    roster = [
+        {'first_name': 'Test', 'last_name': username, 'username': username, **dict(zip(FIELDS, counts))}
+        for username, counts in zip(usernames, totals[FIELDS].itertuples(index=False))
+    ]
+    shuffle = random.Random(seed)
+    for member in shuffle.sample(roster, roster_size // 20):
+        member['likes'] += 1
+        member['total_points'] += POINTS['likers']
+    return roster, interactions
+
+
+def report(result, timings, limit):
+    diffs, drifted, merged = result['diffs'], result['drifted'], result['merged']
+    summary = {
+        'members': int(len(merged)),
+        'matching': int((~drifted & ~result['explained']).sum()),
+        'explained_by_multi_tags': int(result['explained'].sum()),
+        'drifted': int(drifted.sum()),
+        'not_on_roster': int(len(result['not_on_roster'])),
+        'net_drift': {field: int(diffs.loc[drifted, field].sum()) for field in FIELDS},
+        'timings_ms': {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+    }
+
+    print(f"{summary['members']} members: {summary['matching']} match the history, "
+          f"{summary['explained_by_multi_tags']} off only by multi-tag screenshots, {summary['drifted']} drifted")
+    if summary['not_on_roster']:
+        print(f"{summary['not_on_roster']} usernames in the history aren't on the roster (deleted or archived)")
+    if summary['drifted']:
+        net = ', '.join(f"{field} {value:+d}" for field, value in summary['net_drift'].items())
+        print(f"net drift (roster - history): {net}")
+        print()
+        print('roster vs history:')
+        print(f"{'username':<32}" + ''.join(f"{field:>20}" for field in FIELDS))
+        worst = diffs.loc[drifted, 'total_points'].abs().sort_values(ascending=False, kind='stable').index[:limit]
+        for idx in worst:
+            cells = [f"{merged.at[idx, field]} vs {merged.at[idx, field + '_log']}" for field in FIELDS]
+            print(f"{merged.at[idx, 'username']:<32}" + ''.join(f"{cell:>20}" for cell in cells))
+        if summary['drifted'] > limit:
+            print(f"... and {summary['drifted'] - limit} more (--limit to see more)")
+    print()
+    print('timings: ' + ', '.join(f"{stage} {ms:.0f}ms" for stage, ms in summary['timings_ms'].items()))
+
+    summary['drifted_members'] = [
+        {'username': merged.at[idx, 'username'], **{field: int(diffs.at[idx, field]) for field in FIELDS}}
+        for idx in diffs.index[drifted]
+    ]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute member totals from the interaction history and report drift')
+    parser.add_argument('--dir', default=HERE, help='folder with the roster CSV + interaction files (default: next to this script)')
+    parser.add_argument('--sqlite', help='check this sqlite database instead of the CSV/JSON files')
+    parser.add_argument('--write', action='store_true', help='save the recomputed totals back to the roster (app must be stopped)')
+    parser.add_argument('--synthetic', type=int, metavar='N', help='skip the real data, time N made-up interactions instead')
+    parser.add_argument('--roster', type=int, default=5000, help='roster size for --synthetic')
+    parser.add_argument('--seed', type=int, default=352)
+    parser.add_argument('--limit', type=int, default=25, help='drifted members to list')
+    parser.add_argument('--json', help='also write the summary + every drifted member to this file')
+    args = parser.parse_args()
+    if args.write and args.synthetic:
+        parser.error('--write only makes sense on real data')
+    json_path = os.path.abspath(args.json) if args.json else None  # before chdir'ing to --dir
+
+    timings = {}
+    started = time.perf_counter()
+    store = None
+    load_stage = 'load'
+    if args.synthetic:
+        roster, interactions = synthetic_data(args.synthetic, args.roster, args.seed)
+        load_stage = 'generate'
+    elif args.sqlite:
+        from sqlite_store import SQLiteStore
+        store = SQLiteStore(args.sqlite)
+        roster, interactions, _, _ = store.load()
+    else:
+        os.chdir(args.dir)
+        roster = load_roster_from_file() if os.path.exists(ROSTER_FILE) else []
+        interactions = load_interactions_from_files()
+    timings[load_stage] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    columns = interactions_to_columns(interactions)
+    timings['columns'] = time.perf_counter() - started
+    started = time.perf_counter()
+    totals = recompute_totals(columns)
+    timings['group_by'] = time.perf_counter() - started
+    started = time.perf_counter()
+    result = compare(roster, totals)
+    timings['compare'] = time.perf_counter() - started
+
+    print(f"{len(interactions)} interactions, {len(columns['user'])} username entries")
+    summary = report(result, timings, args.limit)
+
+    if args.write and summary['drifted']:
+        rebuilt = rebuilt_roster(roster, result)
+        if store is not None:
+            store.save_roster(rebuilt)
+        else:
+            write_roster_file(rebuilt)
+        print(f"rewrote totals for {summary['drifted']} members")
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+    sys.exit(1 if summary['drifted'] and not args.write else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# reader/writer lock for the in-memory state
+# any number of GETs can read the roster/interactions at once, but a screenshot upload,
+# undo, etc. gets the state to itself. waiting writers go first so a steady stream of
+# leaderboard refreshes can't starve an upload
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writer = None  # thread id holding the write side
+        self.local = threading.local()  # read depth per thread, so nested reads don't deadlock
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self.local, 'depth', 0)
+        # already reading, or writing on this same thread - nothing else to wait for
+        if depth or self.writer == threading.get_ident():
+            self.local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self.local.depth = depth
+            return
+
+        with self.cond:
+            while self.writer is not None or self.writers_waiting:
+                self.cond.wait()
+            self.readers += 1
+        self.local.depth = 1
+        try:
+            yield
+        finally:
+            self.local.depth = 0
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    # not reentrant, and a reader can't upgrade to a writer (that would deadlock)
+    @contextmanager
+    def write(self):
+        if getattr(self.local, 'depth', 0):
+            raise RuntimeError('cannot take the write lock while holding the read lock')
+        with self.cond:
+            self.writers_waiting += 1
+            try:
+                while self.writer is not None or self.readers:
+                    self.cond.wait()
+            finally:
+                self.writers_waiting -= 1
+            self.writer = threading.get_ident()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writer = None
+                self.cond.notify_all()
@@ -0,0 +1,421 @@
+# optional SQLite storage for the IG point tracker
+# turned on with IG_STORAGE=sqlite - lets several gunicorn workers share one database
+# instead of each process owning its own CSV/JSON files
+import sqlite3
+import threading
+import json
+from collections import Counter
+from contextlib import contextmanager
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS members (
+    username TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL DEFAULT '',
+    last_name TEXT NOT NULL DEFAULT '',
+    likes INTEGER NOT NULL DEFAULT 0,
+    comments INTEGER NOT NULL DEFAULT 0,
+    tags INTEGER NOT NULL DEFAULT 0,
+    total_points INTEGER NOT NULL DEFAULT 0,
+    position INTEGER NOT NULL  -- keeps the roster in the order it was uploaded
+);
+
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT,  -- the interaction's own 'id' (what undo removes it by)
+    timestamp TEXT NOT NULL,
+    day TEXT NOT NULL,  -- YYYY-MM-DD, for date filters
+    post_url TEXT NOT NULL DEFAULT '',
+    type TEXT NOT NULL,
+    data TEXT NOT NULL  -- the interaction dict exactly as the app sees it (sorted-key JSON)
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions(timestamp);
+CREATE INDEX IF NOT EXISTS idx_interactions_day ON interactions(day);
+CREATE INDEX IF NOT EXISTS idx_interactions_type ON interactions(type);
+
+-- one row per (interaction, matched username) so per-member queries can use an index
+CREATE TABLE IF NOT EXISTS interaction_users (
+    interaction_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    occurrences INTEGER NOT NULL DEFAULT 1,  -- times the name showed up in that interaction
+    day TEXT NOT NULL,
+    type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_interaction_users_username ON interaction_users(username, day);
+CREATE INDEX IF NOT EXISTS idx_interaction_users_day ON interaction_users(day, type);
+CREATE INDEX IF NOT EXISTS idx_interaction_users_interaction ON interaction_users(interaction_id);
+
+-- credentials + last activity, stored as JSON blobs
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+-- bumped on every write so each worker can tell when someone else changed something
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+-- what each version changed, so other workers can catch up on just that instead of reloading
+-- kind: member (key = username), roster (whole roster replaced), add (key = interactions.id),
+--       remove (key = uid), clear, setting (key = settings key)
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_changes_version ON changes(version);
+
+-- undo history (member deltas + interaction ids, as JSON), newest = highest id
+-- shared so an undo on any worker takes back the last upload made on any of them
+CREATE TABLE IF NOT EXISTS undo_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL
+);
+
+-- queued screenshot jobs as the client sees them, so any worker can answer a status poll
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+'''
+
+CHANGES_KEPT = 5000  # versions of change rows kept - a worker further behind than that reloads everything
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()  # one connection per thread
+        self.version_lock = threading.Lock()
+        self.seen_version = None  # last version this process loaded or wrote itself
+
+        conn = self.connection()
+        conn.execute('PRAGMA journal_mode=WAL')  # readers don't block the writer
+        conn.executescript(SCHEMA)
+        self.upgrade_schema(conn)
+
+    # databases made before interactions had their own uid column - undo used to find rows
+    # by comparing the whole JSON blob, which needed an index on it
+    def upgrade_schema(self, conn):
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(interactions)')}
+        if 'uid' not in columns:
+            conn.execute('ALTER TABLE interactions ADD COLUMN uid TEXT')
+            conn.execute("UPDATE interactions SET uid = json_extract(data, '$.id')")
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_interactions_uid ON interactions(uid)')
+        conn.execute('DROP INDEX IF EXISTS idx_interactions_data')
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # autocommit mode - transactions are started explicitly in transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')  # safe with WAL, way fewer fsyncs
+            self.local.conn = conn
+            self.local.depth = 0
+            self.local.reading = False
+        return conn
+
+    # BEGIN IMMEDIATE grabs the database write lock up front, so two workers updating
+    # points at the same time take turns instead of overwriting each other
+    # nested calls on the same thread just join the outer transaction
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        if self.local.reading:
+            raise RuntimeError('write attempted inside read_snapshot()')
+        if self.local.depth:
+            self.local.depth += 1
+            try:
+                yield conn
+            finally:
+                self.local.depth -= 1
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        self.local.depth = 1
+        self.local.wrote = False
+        # nobody else can write until we commit, so this is the version our changes get
+        new_version = self.current_version() + 1
+        self.local.version = new_version
+        try:
+            yield conn
+            if self.local.wrote:
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (new_version,))
+                if new_version % 500 == 0:
+                    conn.execute('DELETE FROM changes WHERE version <= ?', (new_version - CHANGES_KEPT,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self.local.depth = 0
+
+        if self.local.wrote:
+            with self.version_lock:
+                # only skip the reload if nobody else wrote in between
+                if self.seen_version is not None and new_version == self.seen_version + 1:
+                    self.seen_version = new_version
+
+    # notes one change in the current transaction, for other workers to pick up
+    def record(self, kind, key=None):
+        self.local.wrote = True
+        self.connection().execute('INSERT INTO changes (version, kind, key) VALUES (?, ?, ?)',
+                                  (self.local.version, kind, None if key is None else str(key)))
+
+    # consistent view of the database across several reads (joins a running transaction)
+    @contextmanager
+    def read_snapshot(self):
+        conn = self.connection()
+        if self.local.depth or self.local.reading:
+            yield conn
+            return
+        conn.execute('BEGIN')
+        self.local.reading = True
+        try:
+            yield conn
+        finally:
+            self.local.reading = False
+            conn.execute('COMMIT')
+
+    def current_version(self):
+        return self.connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    # after catching up on changes_since() without a full load
+    def mark_seen(self, version):
+        with self.version_lock:
+            self.seen_version = version
+
+    # has another worker written since we last loaded?
+    def has_changed(self):
+        with self.version_lock:
+            return self.seen_version != self.current_version()
+
+    def is_empty(self):
+        conn = self.connection()
+        has_members = conn.execute('SELECT 1 FROM members LIMIT 1').fetchone()
+        has_interactions = conn.execute('SELECT 1 FROM interactions LIMIT 1').fetchone()
+        return not has_members and not has_interactions
+
+    # everything the app keeps in memory: (roster, interactions, credentials, last_activity)
+    def load(self):
+        with self.read_snapshot():
+            roster, credentials, last_activity = self.load_state()
+            _, interactions = self.load_interactions()
+        return roster, interactions, credentials, last_activity
+
+    # everything except the interaction history: (roster, credentials, last_activity)
+    def load_state(self):
+        with self.version_lock:
+            self.seen_version = self.current_version()
+
+        return self.load_roster(), self.get_setting('credentials', {}), self.get_setting('last_activity', {})
+
+    def load_roster(self):
+        return [member_from_row(row) for row in self.connection().execute('SELECT * FROM members ORDER BY position')]
+
+    # (version they're current as of, interactions)
+    def load_interactions(self):
+        with self.read_snapshot() as conn:
+            version = self.current_version()
+            loaded = [json.loads(row['data']) for row in conn.execute('SELECT data FROM interactions ORDER BY id')]
+        return version, loaded
+
+    # what changed after version, oldest first, as (current version, [(version, kind, key), ...])
+    # - or (current version, None) when the change rows that far back are gone
+    def changes_since(self, version):
+        conn = self.connection()
+        current = self.current_version()
+        if version is None or version > current:
+            return current, None
+        if version == current:
+            return current, []
+        oldest = conn.execute('SELECT MIN(version) FROM changes').fetchone()[0]
+        if oldest is None or oldest > version + 1:
+            return current, None
+        rows = conn.execute('SELECT version, kind, key FROM changes WHERE version > ? ORDER BY rowid', (version,))
+        return current, [(row['version'], row['kind'], row['key']) for row in rows]
+
+    # these members' rows, in roster order
+    def load_members(self, usernames):
+        usernames = list(usernames)
+        rows = []
+        for start in range(0, len(usernames), 500):  # stay under sqlite's variable limit
+            chunk = usernames[start:start + 500]
+            rows.extend(self.connection().execute(
+                f"SELECT * FROM members WHERE username IN ({','.join('?' * len(chunk))})", chunk))
+        return [member_from_row(row) for row in sorted(rows, key=lambda row: row['position'])]
+
+    # {row id: interaction} for the ones still there (an 'add' change's key is the row id)
+    def load_interactions_by_rowid(self, rowids):
+        rowids = list(rowids)
+        loaded = {}
+        for start in range(0, len(rowids), 500):
+            chunk = rowids[start:start + 500]
+            for row in self.connection().execute(
+                    f"SELECT id, data FROM interactions WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                loaded[row['id']] = json.loads(row['data'])
+        return loaded
+
+    def get_setting(self, key, default):
+        row = self.connection().execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def save_setting(self, key, value):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+            self.record('setting', key)
+
+    # replaces the whole roster - for uploads/deletes that change who's on it or the order
+    def save_roster(self, roster):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM members')
+            conn.executemany(
+                'INSERT OR IGNORE INTO members (username, first_name, last_name, likes, comments, tags, total_points, position) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (m['username'], m['first_name'], m['last_name'], m['likes'], m['comments'], m['tags'], m['total_points'], position)
+                    for position, m in enumerate(roster)
+                ]
+            )
+            self.record('roster')
+
+    # just these members' rows - points after an upload/undo, or someone new (goes on the end)
+    def save_members(self, members):
+        with self.transaction() as conn:
+            for m in members:
+                conn.execute(
+                    'INSERT INTO members (username, first_name, last_name, likes, comments, tags, total_points, position) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(position) + 1, 0) FROM members)) '
+                    'ON CONFLICT(username) DO UPDATE SET first_name = excluded.first_name, last_name = excluded.last_name, '
+                    'likes = excluded.likes, comments = excluded.comments, tags = excluded.tags, total_points = excluded.total_points',
+                    (m['username'], m['first_name'], m['last_name'], m['likes'], m['comments'], m['tags'], m['total_points'])
+                )
+                self.record('member', m['username'])
+
+    def add_interactions(self, new_interactions):
+        with self.transaction() as conn:
+            for interaction in new_interactions:
+                day = interaction['timestamp'][:10]
+                cursor = conn.execute(
+                    'INSERT INTO interactions (uid, timestamp, day, post_url, type, data) VALUES (?, ?, ?, ?, ?, ?)',
+                    (
+                        interaction.get('id'),
+                        interaction['timestamp'],
+                        day,
+                        interaction.get('postUrl', interaction.get('post_url', '')),
+                        interaction['type'],
+                        json.dumps(interaction, sort_keys=True)
+                    )
+                )
+                conn.executemany(
+                    'INSERT INTO interaction_users (interaction_id, username, occurrences, day, type) VALUES (?, ?, ?, ?, ?)',
+                    [
+                        (cursor.lastrowid, username, count, day, interaction['type'])
+                        for username, count in Counter(interaction['usernames']).items()
+                    ]
+                )
+                self.record('add', cursor.lastrowid)
+
+    # removes interactions by their 'id' (what the in-memory undo removes)
+    def remove_interactions(self, uids):
+        with self.transaction() as conn:
+            for uid in uids:
+                ids = [row['id'] for row in conn.execute('SELECT id FROM interactions WHERE uid = ?', (uid,))]
+                conn.executemany('DELETE FROM interaction_users WHERE interaction_id = ?', [(i,) for i in ids])
+                conn.executemany('DELETE FROM interactions WHERE id = ?', [(i,) for i in ids])
+                self.record('remove', uid)
+
+    def clear_interactions(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM interaction_users')
+            conn.execute('DELETE FROM interactions')
+            self.record('clear')
+
+    # likes/comments/tags/points per username for interactions dated start_day..end_day
+    # scored like the date-range leaderboard: comments capped per post, tags 1 each
+    def points_in_range(self, start_day=None, end_day=None, points=None, max_points_per_comment=4):
+        points = points or {'likers': 1, 'commenters': 1, 'tagged_users': 5}
+        clauses, params = [], []
+        if start_day:
+            clauses.append('day >= ?')
+            params.append(start_day)
+        if end_day:
+            clauses.append('day <= ?')
+            params.append(end_day)
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+
+        query = f'''
+            SELECT username,
+                   SUM(CASE WHEN type = 'likes' THEN occurrences ELSE 0 END) AS likes,
+                   SUM(CASE WHEN type = 'comments' THEN occurrences * occurrences ELSE 0 END) AS comments,
+                   SUM(CASE WHEN type = 'tags' THEN occurrences ELSE 0 END) AS tags,
+                   SUM(CASE type
+                           WHEN 'likes' THEN occurrences * ?
+                           WHEN 'comments' THEN occurrences * MIN(occurrences, ?) * ?
+                           WHEN 'tags' THEN occurrences * ?
+                           ELSE 0 END) AS total_points
+            FROM interaction_users
+            {where}
+            GROUP BY username
+        '''
+        rows = self.connection().execute(
+            query,
+            [points['likers'], max_points_per_comment, points['commenters'], points['tagged_users']] + params
+        )
+        return {row['username']: [row['likes'], row['comments'], row['tags'], row['total_points']] for row in rows}
+
+    # undo entries and jobs don't touch anything other workers keep in memory, so they're
+    # written without recording a change (no version bump, nobody has to sync)
+    def push_undo(self, entry, limit):
+        with self.transaction() as conn:
+            cursor = conn.execute('INSERT INTO undo_entries (data) VALUES (?)', (json.dumps(entry),))
+            conn.execute('DELETE FROM undo_entries WHERE id <= ?', (cursor.lastrowid - limit,))
+
+    # removes and returns the newest undo entry, or None
+    def pop_undo(self):
+        with self.transaction() as conn:
+            row = conn.execute('SELECT id, data FROM undo_entries ORDER BY id DESC LIMIT 1').fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM undo_entries WHERE id = ?', (row['id'],))
+        return json.loads(row['data'])
+
+    # (entries available, newest entry or None)
+    def undo_status(self):
+        with self.read_snapshot() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM undo_entries').fetchone()[0]
+            row = conn.execute('SELECT data FROM undo_entries ORDER BY id DESC LIMIT 1').fetchone()
+        return count, json.loads(row['data']) if row else None
+
+    def clear_undo(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM undo_entries')
+
+    # inserts or updates a job, then forgets the oldest finished ones past keep
+    def save_job(self, job, keep):
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO jobs (id, status, data) VALUES (?, ?, ?) '
+                         'ON CONFLICT(id) DO UPDATE SET status = excluded.status, data = excluded.data',
+                         (job['id'], job['status'], json.dumps(job)))
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND rowid NOT IN "
+                         "(SELECT rowid FROM jobs ORDER BY rowid DESC LIMIT ?)", (keep,))
+
+    def load_job(self, job_id):
+        row = self.connection().execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+
+def member_from_row(row):
+    return {
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'username': row['username'],
+        'likes': row['likes'],
+        'comments': row['comments'],
+        'tags': row['tags'],
+        'total_points': row['total_points']
+    }
@@ -0,0 +1,74 @@
+# binary copy of everything the app loads at startup, so a restart doesn't have to re-parse
+# the CSV/JSON files. it's only ever a cache - the CSV/JSON files stay the real data, and any
+# part whose source file changed since the snapshot was written gets read from that file instead
+#
+# layout: header (magic + format version), then two pickles one after the other
+#   1. state   - roster, credentials, last activity + fingerprints of the files they came from
+#   2. history - the interactions + their per-day stats, read separately the first time they're needed
+# pickle protocol 5, so only load snapshots this app wrote itself
+import gc
+import os
+import pickle
+import struct
+
+from atomicfile import atomic_open
+
+MAGIC = b'IGPTSNAP'
+FORMAT_VERSION = 2  # bump when the layout of either pickle changes - older files just get ignored
+# 2: heatmap leaves out the old noon-stamped interactions
+HEADER = struct.Struct('>8sH')
+PROTOCOL = 5
+
+
+# identifies one version of a file without reading it - every save is an os.replace,
+# so even a same-size rewrite within the same tick gets a new inode
+def fingerprint(path):
+    try:
+        return stat_fingerprint(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+def stat_fingerprint(stat):
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def write(path, state, history):
+    with atomic_open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        pickle.dump(state, f, protocol=PROTOCOL)
+        pickle.dump(history, f, protocol=PROTOCOL)
+
+
+# returns (state, where the history starts, fingerprint of the file it was read from),
+# or (None, None, None) if there's no usable snapshot
+def read_state(path):
+    try:
+        with open(path, 'rb') as f:
+            magic, version = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None, None, None
+            state = pickle.load(f)
+            return state, f.tell(), stat_fingerprint(os.fstat(f.fileno()))
+    except (OSError, struct.error, pickle.UnpicklingError, EOFError, ValueError):
+        return None, None, None
+
+
+# the second pickle - None if the file is damaged, or isn't the one read_state() read anymore
+# (a save in between replaces it, and the offset would point into the middle of the new one)
+def read_history(path, offset, expected_fingerprint):
+    # the garbage collector would keep rescanning the hundreds of thousands of dicts being
+    # created here (over half the load time) - none of them can be garbage yet
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, 'rb') as f:
+            if stat_fingerprint(os.fstat(f.fileno())) != expected_fingerprint:
+                return None
+            f.seek(offset)
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    finally:
+        if gc_was_enabled:
+            gc.enable()
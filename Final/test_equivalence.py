@@ -0,0 +1,200 @@
+# randomized checks that the fast paths still give exactly what the simple code they replaced did
+# (fixed seeds, so a failure always comes back the same way)
+#
+#   python -m unittest test_equivalence      # from this folder, pytest works too
+import random
+import re
+import unittest
+from datetime import datetime
+from difflib import SequenceMatcher
+
+import IG_point_tracking as app_mod
+from ocr_parser import date_parser, parse_screenshot_text
+from ranking import Leaderboard
+
+
+# the old fuzzy_match - every roster username through the full SequenceMatcher ratio
+def full_scan_match(text, roster_usernames):
+    text_lower = text.lower().strip().replace('@', '')
+    return [username for username in roster_usernames
+            if SequenceMatcher(None, text_lower, username.lower()).ratio() >= app_mod.FUZZY_MATCH_THRESHOLD]
+
+
+class UsernameMatcherTest(unittest.TestCase):
+    ALPHABET = 'abcde._1'
+
+    def random_word(self, rng, max_length):
+        return ''.join(rng.choice(self.ALPHABET) for _ in range(rng.randint(0, max_length)))
+
+    def test_matches_full_scan(self):
+        rng = random.Random(4)
+        # a small alphabet so plenty of words land near the threshold
+        usernames = [self.random_word(rng, 12) for _ in range(200)] + ['Emma.Silva', 'j_doe', 'x']
+        matcher = app_mod.UsernameMatcher(usernames)
+        for _ in range(1000):
+            text = self.random_word(rng, 14)
+            if rng.random() < 0.4:
+                # a near miss of a real username: one character swapped in, maybe an @ in front
+                username = rng.choice(usernames)
+                cut = rng.randint(0, len(username))
+                text = rng.choice(['', '@']) + username[:cut] + rng.choice(self.ALPHABET) + username[cut + 1:]
+            if rng.random() < 0.1:
+                text = text.upper() + rng.choice(['', ' ', '\n'])
+            self.assertEqual(matcher.match(text), full_scan_match(text, usernames), repr(text))
+
+
+# the old inline parsing from IG_point_tracking.py, minus the debug logging
+def inline_parse(text, interaction_type, manual_username=''):
+    extracted_date = None
+    date_patterns = [
+        r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2}',
+        r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}'
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            try:
+                if date_parser:
+                    extracted_date = date_parser.parse(match.group() + f" {datetime.now().year}").date().isoformat()
+            except Exception:
+                pass
+            break
+
+    story_mention_count = len(re.findall(r'mentioned\s+you\s+in\s+(their|a)\s+story', text, re.IGNORECASE))
+    post_tag_count = len(re.findall(r'tagged\s+you\s+in\s+(a|their)\s+post', text, re.IGNORECASE))
+    total_tag_occurrences = story_mention_count + post_tag_count
+
+    potential_usernames = []
+    if manual_username and interaction_type == 'tags':
+        potential_usernames = [manual_username]
+    elif interaction_type == 'tags' and total_tag_occurrences > 0:
+        first_lines = text.split('\n')[:10]
+        for line in first_lines:
+            line = line.strip()
+            if not line or len(line) < 2:
+                continue
+            if any(skip in line.lower() for skip in ['mentioned', 'tagged', 'story', 'post', 'notification', 'at ', 'pm', 'am', 'sep', 'oct', 'nov', 'dec']):
+                continue
+            if line.startswith('_') or '@' in line:
+                clean_word = line.strip('@.,!?(){}[]"\'').strip()
+                if clean_word and 2 <= len(clean_word) <= 30:
+                    potential_usernames.append(clean_word)
+                    break
+
+        if not potential_usernames:
+            for line in first_lines[:5]:
+                line = line.strip()
+                if not line:
+                    continue
+                if any(skip in line.lower() for skip in ['mentioned', 'tagged', 'story', 'post', 'sep', 'oct', 'nov', 'dec', 'at ', 'pm', 'am']):
+                    continue
+                for word in line.split():
+                    clean_word = word.strip('@.,!?(){}[]"\'')
+                    if clean_word and 2 <= len(clean_word) <= 30:
+                        alphanumeric_count = sum(c.isalnum() or c in '._' for c in clean_word)
+                        if alphanumeric_count >= len(clean_word) * 0.8:
+                            potential_usernames.append(clean_word)
+                            break
+                if potential_usernames:
+                    break
+    else:
+        for line in text.split('\n'):
+            line = line.strip()
+            if '@' in line or any(c.isalnum() for c in line):
+                for word in line.split():
+                    clean_word = word.strip("@.,!?(){}[]")
+                    if clean_word and len(clean_word) > 2:
+                        potential_usernames.append(clean_word)
+
+    return {
+        'extracted_date': extracted_date,
+        'total_tag_occurrences': total_tag_occurrences,
+        'potential_usernames': potential_usernames
+    }
+
+
+class ScreenshotParserTest(unittest.TestCase):
+    # pieces of real notification text plus the awkward stuff OCR spits out (odd unicode, stray
+    # punctuation, too-long words, words that only contain a skip word)
+    TOKENS = ['Dec', 'December', 'dec', 'may', 'Jan', 'January', '3', '17', '175', 'mentioned', 'you', 'in',
+              'their', 'a', 'story', 'tagged', 'post', 'notification', '@foo_bar', '_hidden', 'emma.silva', 'x',
+              '!!', '\u2014', '...', '(a)', 'at', 'pm', 'AM', 'Follow', 'liked', '\u0130stanbul', 'ab', 'a.b_c', '@',
+              '@@', 'Sept', '12', '"q"', 'Mentioned', 'YOU', 'Story', 'octopus', 'x' * 31, '_' * 3, 'nov1',
+              'Notification', '\u00e9', '\u0661\u0662']
+    SEPARATORS = [' ', '  ', '\n', '\n', '\t', ' \n ', '\r\n', '\x0c']
+    # whole phrases now and then, otherwise hardly any text counts a tag and reaches the handle search
+    PHRASES = ['mentioned you in their story', 'Mentioned you in a\nstory', 'tagged you in a post',
+               'TAGGED YOU IN THEIR POST', 'Dec 17', 'september  3']
+
+    def random_token(self, rng):
+        return rng.choice(self.PHRASES) if rng.random() < 0.08 else rng.choice(self.TOKENS)
+
+    def test_matches_inline_parsing(self):
+        rng = random.Random(18)
+        for _ in range(20000):
+            text = ''.join(self.random_token(rng) + rng.choice(self.SEPARATORS) for _ in range(rng.randint(0, 25)))
+            interaction_type = rng.choice(['likes', 'comments', 'tags', 'tags'])
+            manual_username = rng.choice(['', '', 'someone'])
+            expected = inline_parse(text, interaction_type, manual_username)
+            result = parse_screenshot_text(text, interaction_type, manual_username)
+            self.assertEqual({key: result[key] for key in expected}, expected,
+                             (text, interaction_type, manual_username))
+
+
+class LeaderboardTest(unittest.TestCase):
+    # what the leaderboard used to be - a stable sort of the roster, so ties stay in roster order
+    def sorted_roster(self, roster):
+        return sorted(roster, key=lambda member: member['total_points'], reverse=True)
+
+    def assertSameMembers(self, members, expected):
+        self.assertEqual([id(member) for member in members], [id(member) for member in expected])
+
+    def check(self, rng, board, roster):
+        ranked = self.sorted_roster(roster)
+        self.assertEqual(len(board), len(roster))
+        self.assertSameMembers(board.top(), ranked)
+        for _ in range(5):
+            count = rng.randint(0, len(ranked) + 2)
+            self.assertSameMembers(board.top(count), ranked[:count])
+            start = rng.randint(0, len(ranked) + 2)
+            self.assertSameMembers(board.page(start, count), ranked[start:start + count])
+        for rank, member in enumerate(ranked, start=1):
+            self.assertEqual(board.rank(member), rank)
+        if ranked:
+            rank = rng.randint(1, len(ranked))
+            member = ranked[rank - 1]
+            radius = rng.randint(0, 4)
+            first = max(1, rank - radius)
+            first_rank, members = board.around(member, radius)
+            self.assertEqual(first_rank, first)
+            self.assertSameMembers(members, ranked[first - 1:rank + radius])
+        self.assertIsNone(board.rank({'total_points': 0}))
+
+    def test_matches_sorted_roster(self):
+        rng = random.Random(22)
+        roster = [{'total_points': rng.randint(0, 20)} for _ in range(50)]
+        board = Leaderboard()
+        board.rebuild(roster)
+        for _ in range(1500):
+            action = rng.random()
+            if action < 0.25:
+                member = {'total_points': rng.randint(0, 20)}
+                roster.append(member)
+                board.add(member)
+            elif action < 0.95 and roster:
+                # small points range so there are always plenty of ties
+                member = rng.choice(roster)
+                member['total_points'] = max(0, member['total_points'] + rng.choice([-5, -1, 0, 1, 1, 5]))
+                board.update(member)
+            else:
+                # delete someone or reorder the roster (a CSV upload), then start over
+                if roster and rng.random() < 0.5:
+                    roster.pop(rng.randrange(len(roster)))
+                else:
+                    rng.shuffle(roster)
+                board.rebuild(roster)
+            self.check(rng, board, roster)
+
+
+if __name__ == '__main__':
+    unittest.main()